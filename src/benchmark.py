@@ -0,0 +1,62 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import argparse
+import asyncio
+import inspect
+from benchmarks.checks import Checks
+from benchmarks.harness import BenchmarkReport
+from benchmarks.suite import BenchmarkSuite
+
+async def main():
+    # Runs the snippets against a local mock of Microsoft Graph,
+    # no tenant or sign in required
+    parser = argparse.ArgumentParser(description='Benchmark the Graph snippets offline')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--payload-items', type=int, nargs='+', default=[1, 10],
+                        help='number of items in collection responses')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated service latency in seconds')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='results file from an earlier run to compare against')
+    parser.add_argument('--check-stall', action='store_true',
+                        help='only check that token refreshes don\'t stall the event loop')
+    parser.add_argument('--check', action='store_true',
+                        help='only run the offline regression checks')
+    args = parser.parse_args()
+
+    if args.check:
+        # Exits with an AssertionError when a check fails
+        for name, check in inspect.getmembers(Checks, inspect.isfunction):
+            await check()
+            print(name, 'passed')
+        return
+
+    suite = BenchmarkSuite(args.iterations, args.concurrency, args.payload_items, args.latency)
+    if args.check_stall:
+        # Exits with an AssertionError when the check fails
+        for variant, stall in (await suite.check_credential_stall()).items():
+            print(f'credential.{variant} max stall {stall:.2f} ms')
+        return
+
+    results = await suite.run()
+
+    for result in results:
+        if 'error' in result:
+            print(f'{result["name"]} {result["parameters"]} failed: {result["error"]}')
+        else:
+            print(f'{result["name"]} {result["parameters"]} '
+                  f'p50 {result["p50_ms"]:.2f} ms, p99 {result["p99_ms"]:.2f} ms, '
+                  f'{result["requests_per_second"]:.0f}/s')
+
+    BenchmarkReport.save(results, args.output, vars(args))
+    print('Results saved to', args.output)
+
+    if args.compare:
+        for line in BenchmarkReport.compare(args.compare, results):
+            print(line)
+
+# Run benchmarks
+asyncio.run(main())
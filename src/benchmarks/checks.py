@@ -0,0 +1,91 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import os
+import tempfile
+import httpx
+from msgraph.generated.models.event import Event
+from benchmarks.mock_graph import MockGraphServer
+from snippets.large_file_upload import CHUNK_MULTIPLE, ChunkedUpload, UploadOptions
+from snippets.middleware.cache_middleware import CacheMiddleware
+
+class _RevalidationServer(MockGraphServer):
+    # Serves one event. A conditional GET waits until a write to the events
+    # collection has landed, then answers 304
+    def __init__(self) -> None:
+        super().__init__()
+        self.subject = 'Before'
+        self.revalidating = asyncio.Event()
+        self.written = asyncio.Event()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == 'POST':
+            self.subject = 'After'
+            self.written.set()
+            return httpx.Response(201, json={'id': '1', 'subject': self.subject})
+        if request.headers.get('if-none-match') == '"Before"':
+            self.revalidating.set()
+            await self.written.wait()
+            return httpx.Response(304)
+        return httpx.Response(200, headers={'ETag': f'"{self.subject}"'},
+                              json={'id': '1', 'subject': self.subject})
+
+class Checks:
+    # Regression checks that run offline, each raises AssertionError when
+    # it fails. Run them with benchmark.py --check
+    @staticmethod
+    async def cache_invalidated_during_revalidation() -> None:
+        # A write to the same route lands while a conditional GET is in
+        # flight. The 304 must not touch the invalidated entry, the event
+        # is fetched again instead
+        server = _RevalidationServer()
+        cache = CacheMiddleware(ttl_rules=[('.', 0.001)])
+        graph_client = server.create_client([cache])
+        event = graph_client.me.events.by_event_id('1')
+        await event.get()
+        await asyncio.sleep(0.01)
+
+        read = asyncio.ensure_future(event.get())
+        await server.revalidating.wait()
+        await graph_client.me.events.post(Event(subject='After'))
+        result = await read
+
+        if result is None or result.subject != 'After':
+            raise AssertionError(f'Got {result.subject if result else None!r} after the write')
+        if cache.revalidated:
+            raise AssertionError('An invalidated entry was revalidated')
+
+    @staticmethod
+    async def upload_resumes_from_unaligned_offset() -> None:
+        # The server asks for the rest of the file from an offset that isn't
+        # on a page boundary, the upload must carry on from there
+        total = 3 * CHUNK_MULTIPLE + 123
+        resume_at = CHUNK_MULTIPLE + 1001
+        received: list[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.method == 'GET':
+                return httpx.Response(200, json={'nextExpectedRanges': [f'{resume_at}-']})
+            content_range = request.headers['content-range']
+            received.append(content_range)
+            if len(received) == 2:
+                return httpx.Response(503)
+            last = int(content_range.split('-')[1].split('/')[0])
+            return httpx.Response(201 if last == total - 1 else 202)
+
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(os.urandom(total))
+        try:
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                upload = ChunkedUpload('https://upload.example/session', file.name,
+                                       UploadOptions(chunk_size=CHUNK_MULTIPLE, retry_delay=0.0))
+                response = await upload.upload(client)
+        finally:
+            os.remove(file.name)
+
+        if response.status_code != 201 or upload.bytes_uploaded != total:
+            raise AssertionError(f'Upload ended with {response.status_code} after '
+                                 f'{upload.bytes_uploaded} of {total} bytes')
+        if not received[2].startswith(f'bytes {resume_at}-'):
+            raise AssertionError(f'Resumed with {received[2]}, not from {resume_at}')
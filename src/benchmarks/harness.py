@@ -0,0 +1,176 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import contextlib
+import json
+import platform
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is reported as None there
+    resource = None # type: ignore
+
+class LoopStallMonitor:
+    def __init__(self, interval: float = 0.005) -> None:
+        # Wakes up every interval seconds and records how late it was. Any
+        # lateness is time the event loop spent blocked, when no other
+        # request could make progress
+        self._interval = interval
+        self._stalls: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._stalls = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> list[float]:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        return sorted(self._stalls)
+
+    async def _run(self) -> None:
+        while True:
+            due = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            self._stalls.append(max(time.perf_counter() - due, 0.0))
+
+class Benchmark:
+    @staticmethod
+    async def measure_async(
+        name: str,
+        operation: Callable[[], Awaitable[Any]],
+        iterations: int,
+        concurrency: int = 1,
+        parameters: dict[str, Any] | None = None) -> dict[str, Any]:
+        # Runs operation iterations times, with up to concurrency calls in flight
+        await Benchmark._warm_up_async(operation, concurrency)
+
+        latencies: list[float] = []
+        remaining = iterations
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                await operation()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(min(concurrency, iterations))])
+        elapsed = time.perf_counter() - started
+
+        return Benchmark.summarize(
+            name, latencies, elapsed, {'concurrency': concurrency, **(parameters or {})})
+
+    @staticmethod
+    def measure_sync(
+        name: str,
+        operation: Callable[[], Any],
+        iterations: int,
+        parameters: dict[str, Any] | None = None) -> dict[str, Any]:
+        operation()
+
+        latencies: list[float] = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            call_started = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+
+        return Benchmark.summarize(name, latencies, elapsed, parameters or {})
+
+    @staticmethod
+    async def _warm_up_async(operation: Callable[[], Awaitable[Any]], count: int) -> None:
+        # The first calls pay for imports, connection setup and parse node
+        # factory registration, keep them out of the numbers
+        await asyncio.gather(*[operation() for _ in range(max(count, 1))])
+
+    @staticmethod
+    def summarize(
+        name: str,
+        latencies: list[float],
+        elapsed: float,
+        parameters: dict[str, Any]) -> dict[str, Any]:
+        latencies = sorted(latencies)
+        return {
+            'name': name,
+            'parameters': parameters,
+            'iterations': len(latencies),
+            'p50_ms': Benchmark.percentile(latencies, 50) * 1000,
+            'p99_ms': Benchmark.percentile(latencies, 99) * 1000,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+            'peak_rss_bytes': Benchmark.peak_rss_bytes(),
+        }
+
+    @staticmethod
+    def percentile(sorted_values: list[float], percent: float) -> float:
+        # Nearest-rank percentile of an already sorted list
+        if not sorted_values:
+            return 0.0
+        rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+        return sorted_values[min(rank, len(sorted_values) - 1)]
+
+    @staticmethod
+    def peak_rss_bytes() -> int | None:
+        # Peak for the whole process so far, so it only grows between benchmarks
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+class BenchmarkReport:
+    @staticmethod
+    def save(results: list[dict[str, Any]], path: str, parameters: dict[str, Any]) -> None:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': parameters,
+            'results': results,
+        }
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    @staticmethod
+    def compare(
+        baseline_path: str,
+        results: list[dict[str, Any]],
+        threshold: float = 0.1) -> list[str]:
+        # Returns a line per benchmark found in both runs. Results are
+        # matched on name and parameters, a p50 or p99 more than threshold
+        # slower than the baseline is flagged as a regression
+        with open(baseline_path, 'r', encoding='utf-8') as baseline_file:
+            baseline = {BenchmarkReport._key(result): result
+                        for result in json.load(baseline_file)['results']}
+
+        lines = []
+        for result in results:
+            previous = baseline.get(BenchmarkReport._key(result))
+            if previous is None or 'error' in result or 'error' in previous:
+                continue
+            changes = [(metric, BenchmarkReport._change(previous[metric], result[metric]))
+                       for metric in ('p50_ms', 'p99_ms')]
+            flag = 'REGRESSION ' if any(change > threshold for _, change in changes) else ''
+            lines.append(f'{flag}{result["name"]} {result["parameters"]} ' +
+                         ' '.join(f'{metric} {change:+.1%}' for metric, change in changes))
+        return lines
+
+    @staticmethod
+    def _key(result: dict[str, Any]) -> str:
+        return f'{result["name"]} {json.dumps(result["parameters"], sort_keys=True)}'
+
+    @staticmethod
+    def _change(previous: float, current: float) -> float:
+        return (current - previous) / previous if previous else 0.0
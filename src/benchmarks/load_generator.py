@@ -0,0 +1,238 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import importlib
+import inspect
+import time
+from typing import Any, Awaitable, Callable
+from msgraph.graph_service_client import GraphServiceClient
+from benchmarks.harness import Benchmark
+from benchmarks.suite import REQUEST_SNIPPETS, SNIPPET_ARGUMENTS
+from snippets.create_requests import CreateRequests
+
+# How snippet arguments are found in a real tenant, the mock server
+# uses the fixed ids in SNIPPET_ARGUMENTS instead
+ARGUMENT_FACTORIES: dict[str, Callable[[GraphServiceClient], Awaitable[Any]]] = {
+    'message_id': CreateRequests.create_temporary_message,
+    'team_id': CreateRequests.get_team_id,
+}
+
+# Deletes what an argument factory created, once the run is over
+ARGUMENT_CLEANUPS: dict[str, Callable[[GraphServiceClient, Any], Awaitable[Any]]] = {
+    'message_id': CreateRequests.make_delete_request,
+}
+
+# Snippets whose names contain these words create or delete something.
+# They're left out of the warm-up, which would create an extra item or
+# delete the one the run needs
+NON_IDEMPOTENT_WORDS = ('create', 'delete')
+
+Operation = Callable[[], Awaitable[Any]]
+
+# pylint: disable=too-few-public-methods
+class LoadOptions:
+    def __init__(
+        self,
+        concurrency: int = 4,
+        duration: float | None = None,
+        iterations: int | None = None,
+        rate: float | None = None,
+        open_loop: bool = False) -> None:
+        # Runs for duration seconds or iterations calls, whichever is set.
+        # rate is the target calls per second across all methods.
+        # Closed loop: concurrency workers each wait for their call to
+        # finish before starting the next one, rate only caps the pace.
+        # Open loop: calls start on schedule whether or not earlier ones
+        # finished, up to concurrency at once, and latency is measured from
+        # the scheduled start so queueing shows up in the percentiles
+        if (duration is None) == (iterations is None):
+            raise ValueError('Set either duration or iterations')
+        if open_loop and not rate:
+            raise ValueError('An open loop needs a target rate')
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.iterations = iterations
+        self.rate = rate
+        self.open_loop = open_loop
+
+class _MethodStats:
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('latencies', 'errors')
+
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.errors: dict[str, int] = {}
+
+class LoadGenerator:
+    def __init__(self, operations: dict[str, Operation], options: LoadOptions) -> None:
+        # Calls go to the operations in turn, so each gets an equal share
+        self._operations = operations
+        self._names = list(operations)
+        self._options = options
+        self._stats = {name: _MethodStats() for name in self._names}
+        self._started = 0.0
+        self._issued = 0
+
+    async def run(self) -> list[dict[str, Any]]:
+        # Returns one result per method, then one for all methods together.
+        # The first call of each method pays for importing and building its
+        # models, so it's made before the run and left out of the numbers
+        await asyncio.gather(*[operation() for name, operation in self._operations.items()
+                               if LoadGenerator._idempotent(name)],
+                             return_exceptions=True)
+
+        self._started = time.perf_counter()
+        self._issued = 0
+        if self._options.open_loop:
+            await self._run_open_loop()
+        else:
+            await asyncio.gather(*[self._closed_loop_worker()
+                                   for _ in range(self._options.concurrency)])
+        return self._report(time.perf_counter() - self._started)
+
+    @staticmethod
+    def _idempotent(method: str) -> bool:
+        method_name = method.rpartition('.')[2].lower()
+        return not any(word in method_name for word in NON_IDEMPOTENT_WORDS)
+
+    def _next_call(self) -> tuple[int, float] | None:
+        # The index of the next call and when it's due, None once the run is over
+        options = self._options
+        if options.iterations is not None and self._issued >= options.iterations:
+            return None
+
+        index = self._issued
+        due = self._started + index / options.rate if options.rate else time.perf_counter()
+        if options.duration is not None and due - self._started >= options.duration:
+            return None
+
+        self._issued += 1
+        return index, due
+
+    async def _closed_loop_worker(self) -> None:
+        while (call := self._next_call()) is not None:
+            index, due = call
+            await asyncio.sleep(due - time.perf_counter())
+            await self._call(index, time.perf_counter())
+
+    async def _run_open_loop(self) -> None:
+        slots = asyncio.Semaphore(self._options.concurrency)
+        tasks: set[asyncio.Task] = set()
+
+        async def call(index: int, due: float) -> None:
+            async with slots:
+                await self._call(index, due)
+
+        while (next_call := self._next_call()) is not None:
+            index, due = next_call
+            await asyncio.sleep(due - time.perf_counter())
+            task = asyncio.create_task(call(index, due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+
+    async def _call(self, index: int, started: float) -> None:
+        name = self._names[index % len(self._names)]
+        stats = self._stats[name]
+        try:
+            await self._operations[name]()
+        except Exception as error: # pylint: disable=broad-exception-caught
+            error_type = type(error).__name__
+            stats.errors[error_type] = stats.errors.get(error_type, 0) + 1
+            return
+        stats.latencies.append(time.perf_counter() - started)
+
+    def _report(self, elapsed: float) -> list[dict[str, Any]]:
+        options = self._options
+        parameters = {
+            'concurrency': options.concurrency,
+            'duration': options.duration,
+            'iterations': options.iterations,
+            'rate': options.rate,
+            'open_loop': options.open_loop,
+        }
+
+        results = []
+        totals = _MethodStats()
+        for name, stats in self._stats.items():
+            results.append(LoadGenerator._summarize(f'load.{name}', stats, elapsed, parameters))
+            totals.latencies.extend(stats.latencies)
+            for error_type, count in stats.errors.items():
+                totals.errors[error_type] = totals.errors.get(error_type, 0) + count
+
+        results.append(LoadGenerator._summarize('load.total', totals, elapsed, parameters))
+        return results
+
+    @staticmethod
+    def _summarize(
+        name: str,
+        stats: _MethodStats,
+        elapsed: float,
+        parameters: dict[str, Any]) -> dict[str, Any]:
+        # requests_per_second counts successful calls only
+        result = Benchmark.summarize(name, stats.latencies, elapsed, parameters)
+        latencies = sorted(stats.latencies)
+        result['p90_ms'] = Benchmark.percentile(latencies, 90) * 1000
+        result['max_ms'] = latencies[-1] * 1000 if latencies else 0.0
+        result['errors'] = sum(stats.errors.values())
+        result['error_types'] = dict(stats.errors)
+        return result
+
+    @staticmethod
+    async def bind(
+        methods: list[str],
+        graph_client: GraphServiceClient,
+        stub: bool = False,
+        cleanups: list[Operation] | None = None) -> dict[str, Operation]:
+        # methods are names like CreateRequests.make_read_request, or a full
+        # path like snippets.create_requests.CreateRequests.make_read_request.
+        # Arguments after the client are looked up once, before the run
+        # starts. Items created for them are deleted by the operations
+        # appended to cleanups, pass those to clean_up after the run
+        arguments: dict[str, Any] = dict(SNIPPET_ARGUMENTS) if stub else {}
+        operations: dict[str, Operation] = {}
+        for method in methods:
+            snippet = LoadGenerator._resolve(method)
+            values = []
+            for parameter in list(inspect.signature(snippet).parameters)[1:]:
+                if parameter not in arguments:
+                    if parameter not in ARGUMENT_FACTORIES:
+                        raise ValueError(f'No value for the {parameter} argument of {method}')
+                    value = arguments[parameter] = await ARGUMENT_FACTORIES[parameter](
+                        graph_client)
+                    cleanup = ARGUMENT_CLEANUPS.get(parameter)
+                    if cleanup is not None and cleanups is not None:
+                        cleanups.append(lambda cleanup=cleanup, value=value: cleanup(
+                            graph_client, value))
+                values.append(arguments[parameter])
+            operations[method] = lambda snippet=snippet, values=values: snippet(
+                graph_client, *values)
+        return operations
+
+    @staticmethod
+    async def clean_up(cleanups: list[Operation]) -> None:
+        # A failed cleanup is reported, and doesn't stop the others
+        for cleanup in cleanups:
+            try:
+                await cleanup()
+            except Exception as error: # pylint: disable=broad-exception-caught
+                print(f'Cleanup failed: {type(error).__name__}: {error}')
+
+    @staticmethod
+    def _resolve(method: str) -> Callable[..., Awaitable[Any]]:
+        owner_name, _, method_name = method.rpartition('.')
+        module_name, _, class_name = owner_name.rpartition('.')
+        if module_name:
+            owner = getattr(importlib.import_module(module_name), class_name, None)
+        else:
+            owner = next((snippets for snippets in REQUEST_SNIPPETS
+                          if snippets.__name__ == class_name), None)
+
+        snippet = getattr(owner, method_name, None) if owner is not None else None
+        if snippet is None or not inspect.iscoroutinefunction(snippet):
+            raise ValueError(f'{method} is not an async snippet method')
+        return snippet
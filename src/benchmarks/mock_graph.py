@@ -0,0 +1,205 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import gzip
+import json
+import re
+import threading
+import time
+from typing import Any, AsyncIterator
+import httpx
+from azure.core.credentials import AccessToken
+from kiota_abstractions.authentication import AnonymousAuthenticationProvider
+from kiota_authentication_azure.azure_identity_authentication_provider import (
+    AzureIdentityAuthenticationProvider)
+from kiota_http.middleware.middleware import BaseMiddleware
+from msgraph.graph_request_adapter import GraphRequestAdapter, options as graph_options
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph_core import APIVersion, GraphClientFactory, NationalClouds
+from snippets.token_cache import CREDENTIAL_REFRESH_OFFSET
+
+# Ids the mock server hands out, pass them to snippets that need an existing item
+MESSAGE_ID = ('AAMkAGVmMDEzMTM4LTZmYWUtNDdkNC1hMDZiLTU1OGY5OTZhYmY4OABGAAAAAAAiQ8W967B7'
+              'TKBjgx9rVEURBwAiIsqMbYjsT5e-T7KzowPTAAAAAAEMAAAiIsqMbYjsT5e-T7KzowPTAAAYbvZDAAA=')
+TEAM_ID = '02bd9fd6-8f93-4758-87c3-1fb73740a315'
+
+GRAPH_HOST = NationalClouds.Global.value
+
+def _user() -> dict:
+    return {
+        '@odata.context': f'{GRAPH_HOST}/v1.0/$metadata#users/$entity',
+        'id': '87d349ed-44d7-43e1-9a83-5f2406dee5bd',
+        'displayName': 'Adele Vance',
+        'givenName': 'Adele',
+        'surname': 'Vance',
+        'jobTitle': 'Retail Manager',
+        'mail': 'AdeleV@contoso.com',
+        'userPrincipalName': 'AdeleV@contoso.com',
+        'officeLocation': '18/2111',
+        'preferredLanguage': 'en-US',
+        'mobilePhone': None,
+        'businessPhones': ['+1 425 555 0109'],
+    }
+
+def _recipient(name: str) -> dict:
+    return {'emailAddress': {'name': name, 'address': f'{name.replace(" ", "")}@contoso.com'}}
+
+def _message(index: int, body_size: int) -> dict:
+    return {
+        '@odata.etag': 'W/"CQAAABYAAAAiIsqMbYjsT5e/T7KzowPTAAAYbvZD"',
+        'id': MESSAGE_ID if index == 0 else f'{MESSAGE_ID[:-8]}{index:08d}',
+        'createdDateTime': '2023-06-14T17:38:05Z',
+        'receivedDateTime': '2023-06-14T17:38:05Z',
+        'hasAttachments': False,
+        'subject': 'Hello world',
+        'bodyPreview': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit.',
+        'importance': 'normal',
+        'isRead': index % 3 == 0,
+        'body': {'contentType': 'html', 'content': '<p>' + 'Lorem ipsum ' * (body_size // 12)},
+        'sender': _recipient('Megan Bowen'),
+        'from': _recipient('Megan Bowen'),
+        'toRecipients': [_recipient('Adele Vance'), _recipient('Alex Wilber')],
+        'ccRecipients': [],
+        'attachments': [],
+    }
+
+def _event(index: int) -> dict:
+    return {
+        '@odata.etag': 'W/"ZlnW4RIAV06KYYwlrfNZvQAALfZeRQ=="',
+        'id': f'AAMkAGI1AAAt9AHjAAA{index:08d}=',
+        'subject': f'Planning sync {index}',
+        'bodyPreview': 'Weekly planning sync',
+        'isAllDay': False,
+        'isCancelled': False,
+        'showAs': 'busy',
+        'start': {'dateTime': '2023-06-14T16:00:00.0000000', 'timeZone': 'Pacific Standard Time'},
+        'end': {'dateTime': '2023-06-14T16:30:00.0000000', 'timeZone': 'Pacific Standard Time'},
+        'location': {'displayName': 'Conf Room Rainier', 'locationType': 'default'},
+        'organizer': _recipient('Megan Bowen'),
+        'attendees': [{'type': 'required', 'status': {'response': 'accepted'},
+                       **_recipient('Adele Vance')}],
+    }
+
+def _collection(context: str, items: list) -> dict:
+    return {'@odata.context': f'{GRAPH_HOST}/v1.0/$metadata#{context}', 'value': items}
+
+class MockCredential:
+    token_requests: int
+
+    def __init__(self, token_latency: float = 0.1, lifetime: float = 3600.0) -> None:
+        # Behaves like a sync azure.identity credential: it caches its token
+        # and blocks for token_latency seconds whenever it has to get a new
+        # one, which is once the token is within five minutes of expiring
+        self.token_latency = token_latency
+        self.lifetime = lifetime
+        self.token_requests = 0
+        self._token: AccessToken | None = None
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        # pylint: disable=unused-argument
+        with self._lock:
+            if self._token is None or self._token.expires_on - time.time() < \
+                    CREDENTIAL_REFRESH_OFFSET:
+                time.sleep(self.token_latency)
+                self.token_requests += 1
+                self._token = AccessToken('mock-token', int(time.time() + self.lifetime))
+            return self._token
+
+    def close(self) -> None:
+        pass
+
+class _UnreadStream(httpx.AsyncByteStream):
+    # A response built from bytes is read, and decoded, as soon as it's
+    # created. Streamed, the client decodes it as it would one from the network
+    def __init__(self, body: bytes) -> None:
+        self._body = body
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self._body
+
+class MockGraphServer:
+    requests_served: int
+
+    def __init__(self, payload_items: int = 10, body_size: int = 512, latency: float = 0.0,
+                 compress: bool = False) -> None:
+        # payload_items is the number of items in every collection response,
+        # body_size the size in characters of each message body. latency
+        # simulates the service's response time, in seconds. With compress,
+        # bodies are gzipped for requests that accept gzip, like Graph does
+        self.payload_items = payload_items
+        self.latency = latency
+        self.compress = compress
+        self.requests_served = 0
+
+        # Serialize once, so the benchmark measures the client and not the server
+        messages = [_message(index, body_size) for index in range(payload_items)]
+        events = [_event(index) for index in range(payload_items)]
+        self._bodies = {name: json.dumps(body).encode('utf-8') for name, body in {
+            'user': _user(),
+            'message': _message(0, body_size),
+            'messages': _collection('users(\'me\')/messages', messages),
+            'events': _collection('users(\'me\')/events', events),
+            'calendar': {'id': 'AAMkAGI1AAAt9AHkAAA=', 'name': 'Volunteer', 'canEdit': True},
+            'groups': _collection('groups', [{'id': TEAM_ID, 'displayName': 'Mark 8 Project Team',
+                                              'resourceProvisioningOptions': ['Team']}]),
+        }.items()}
+        self._gzip_bodies = {name: gzip.compress(body, compresslevel=6)
+                             for name, body in self._bodies.items()} if compress else {}
+        self._routes = [
+            ('GET', re.compile(r'^/me$'), 200, 'user'),
+            ('GET', re.compile(r'^/me/messages$'), 200, 'messages'),
+            ('POST', re.compile(r'^/me/messages$'), 201, 'message'),
+            ('GET', re.compile(r'^/me/messages/[^/]+$'), 200, 'message'),
+            ('DELETE', re.compile(r'^/me/messages/[^/]+$'), 204, None),
+            ('POST', re.compile(r'^/me/calendars$'), 201, 'calendar'),
+            ('GET', re.compile(r'^/me/(events|calendarview)$', re.IGNORECASE), 200, 'events'),
+            ('GET', re.compile(r'^/groups$'), 200, 'groups'),
+            ('PATCH', re.compile(r'^/teams/[^/]+$'), 204, None),
+        ]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests_served += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # Without the default middleware /me arrives as its URL template
+        path = request.url.path.removeprefix(f'/{APIVersion.v1}').replace(
+            '/users/me-token-to-replace', '/me', 1)
+        for method, pattern, status, body in self._routes:
+            if request.method == method and pattern.match(path):
+                if body is None:
+                    return httpx.Response(status)
+                if self.compress and 'gzip' in request.headers.get('accept-encoding', ''):
+                    compressed = self._gzip_bodies[body]
+                    return httpx.Response(status, stream=_UnreadStream(compressed), headers={
+                        'content-type': 'application/json', 'content-encoding': 'gzip',
+                        'content-length': str(len(compressed))})
+                return httpx.Response(status, content=self._bodies[body],
+                                      headers={'content-type': 'application/json'})
+
+        return httpx.Response(404, json={'error': {
+            'code': 'ResourceNotFound', 'message': f'No mock for {request.method} {path}'}})
+
+    def create_client(
+        self,
+        middleware: list[BaseMiddleware] | None = None,
+        credential: Any = None) -> GraphServiceClient:
+        # middleware replaces the default Graph middleware when set,
+        # pass an empty list to measure the bare HTTP client. Without a
+        # credential no tokens are requested
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle),
+                                        base_url=f'{GRAPH_HOST}/{APIVersion.v1}')
+        if middleware is None:
+            http_client = GraphClientFactory.create_with_default_middleware(
+                client=http_client, options=graph_options)
+        elif middleware:
+            http_client = GraphClientFactory.create_with_custom_middleware(
+                middleware, client=http_client)
+
+        auth_provider = AnonymousAuthenticationProvider() if credential is None else \
+            AzureIdentityAuthenticationProvider(credential, scopes=['User.Read'])
+        adapter = GraphRequestAdapter(auth_provider, http_client)
+        adapter.base_url = f'{GRAPH_HOST}/{APIVersion.v1}'
+        return GraphServiceClient(request_adapter=adapter)
@@ -0,0 +1,279 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable
+from azure.identity import DeviceCodeCredential
+from azure.identity.aio import ClientSecretCredential
+from kiota_http.middleware.middleware import BaseMiddleware
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph_core import GraphClientFactory, NationalClouds
+from benchmarks.harness import Benchmark, LoopStallMonitor
+from benchmarks.mock_graph import MESSAGE_ID, TEAM_ID, MockCredential, MockGraphServer
+from snippets.async_credential import AsyncCredentialAdapter
+from snippets.client_registry import ClientKey, GraphClientRegistry
+from snippets.create_clients import CreateClients
+from snippets.create_requests import CreateRequests
+from snippets.custom_clients import CustomClients
+from snippets.projection_decoder import ProjectionRequests
+from snippets.token_cache import CREDENTIAL_REFRESH_OFFSET
+from snippets.middleware.cache_middleware import CacheMiddleware
+from snippets.middleware.compression_middleware import CompressionMiddleware
+from snippets.middleware.hedging_middleware import HedgingMiddleware
+from snippets.middleware.metrics_middleware import GraphMetrics, MetricsMiddleware
+from snippets.middleware.single_flight_middleware import SingleFlightMiddleware
+from snippets.middleware.throttling_middleware import (
+    ThrottlingMiddleware, ThrottlingOptions)
+
+# Arguments for snippets that work on an existing item
+SNIPPET_ARGUMENTS = {'message_id': MESSAGE_ID, 'team_id': TEAM_ID}
+
+# Client factories that prompt the user, they can't run unattended
+INTERACTIVE_FACTORIES = {'create_with_persistent_token_cache'}
+
+SCOPES = ['User.Read']
+
+# Classes whose make_* methods are measured against the mock server
+REQUEST_SNIPPETS = [CreateRequests, ProjectionRequests]
+
+# Middleware chains compared against the default chain. Factories, so
+# every run starts with empty caches and counters
+MIDDLEWARE_VARIANTS: dict[str, Callable[[], list[BaseMiddleware]]] = {
+    'none': list,
+    'default': lambda: GraphClientFactory.get_default_middleware(None),
+    'default+metrics': lambda: [*GraphClientFactory.get_default_middleware(None),
+                                MetricsMiddleware(GraphMetrics())],
+    'default+cache': lambda: [*GraphClientFactory.get_default_middleware(None),
+                              CacheMiddleware()],
+    # Limits high enough to never wait, so only the bookkeeping is measured
+    'default+throttling': lambda: [*GraphClientFactory.get_default_middleware(None),
+                                   ThrottlingMiddleware(ThrottlingOptions(
+                                       requests_per_second=1e6, burst=1000,
+                                       initial_window=1000, max_window=1000))],
+    'default+compression': lambda: [*GraphClientFactory.get_default_middleware(None),
+                                    CompressionMiddleware()],
+    'default+hedging': lambda: [*GraphClientFactory.get_default_middleware(None),
+                                HedgingMiddleware()],
+    'single-flight+default': lambda: [SingleFlightMiddleware(),
+                                      *GraphClientFactory.get_default_middleware(None)],
+}
+
+# A sync credential called on the event loop, and the same credential on
+# worker threads. Tokens are due for refresh every half second, so requests
+# keep running into refreshes
+CREDENTIAL_VARIANTS: dict[str, Callable[[MockCredential], Any]] = {
+    'sync': lambda credential: credential,
+    'async-adapter': AsyncCredentialAdapter,
+}
+TOKEN_LATENCY = 0.05
+STALL_CHECK_TOKEN_LATENCY = 0.2
+
+class BenchmarkSuite:
+    def __init__(
+        self,
+        iterations: int = 20,
+        concurrency_levels: list[int] | None = None,
+        payload_sizes: list[int] | None = None,
+        latency: float = 0.0) -> None:
+        # payload_sizes is the number of items in collection responses.
+        # Deserializing Graph models is CPU bound, large payloads and many
+        # iterations quickly add up to minutes
+        self.iterations = iterations
+        self.concurrency_levels = concurrency_levels or [1, 4]
+        self.payload_sizes = payload_sizes or [1, 10]
+        self.latency = latency
+
+    async def run(self) -> list[dict[str, Any]]:
+        results = self.client_construction()
+        results.extend(await self.client_acquisition())
+        for payload_items in self.payload_sizes:
+            for concurrency in self.concurrency_levels:
+                results.extend(await self.requests(payload_items, concurrency))
+                results.extend(await self.middleware(payload_items, concurrency))
+        for concurrency in self.concurrency_levels:
+            results.extend(await self.credentials(concurrency))
+        return results
+
+    def client_construction(self) -> list[dict[str, Any]]:
+        factories: list[tuple[str, Callable[[], Any]]] = [
+            (f'CreateClients.{name}', factory)
+            for name, factory in inspect.getmembers(CreateClients, inspect.isfunction)
+            if name.startswith('create_with_') and name not in INTERACTIVE_FACTORIES]
+
+        credential = DeviceCodeCredential('YOUR_CLIENT_ID')
+        factories.append(('CustomClients.create_with_custom_middleware',
+                          lambda: CustomClients.create_with_custom_middleware(credential, SCOPES)))
+        factories.append(('CustomClients.create_with_proxy',
+                          lambda: CustomClients.create_with_proxy(SCOPES)))
+
+        results = []
+        for name, factory in factories:
+            try:
+                results.append(Benchmark.measure_sync(name, factory, self.iterations))
+            except Exception as error: # pylint: disable=broad-exception-caught
+                # For example the certificate snippet, which needs a real certificate file
+                results.append(BenchmarkSuite._failed(name, {}, error))
+        return results
+
+    async def client_acquisition(self) -> list[dict[str, Any]]:
+        # Building a new client for every call, against getting the pooled
+        # one from a registry. No requests are sent
+        key = ClientKey('contoso.onmicrosoft.com', 'YOUR_CLIENT_ID',
+                        ('https://graph.microsoft.com/.default',), NationalClouds.Global.value)
+
+        def credential_factory() -> Any:
+            return ClientSecretCredential(key.tenant_id, key.client_id, 'YOUR_CLIENT_SECRET')
+
+        registries = [GraphClientRegistry()]
+
+        def cold() -> None:
+            registries.append(GraphClientRegistry())
+            registries[-1].get_client(key, credential_factory)
+
+        try:
+            results = [
+                Benchmark.measure_sync('client_registry.cold', cold, self.iterations),
+                Benchmark.measure_sync(
+                    'client_registry.warm',
+                    lambda: registries[0].get_client(key, credential_factory), self.iterations),
+            ]
+        finally:
+            for registry in registries:
+                await registry.aclose()
+
+        if results[1]['p50_ms']:
+            results[1]['speedup'] = results[0]['p50_ms'] / results[1]['p50_ms']
+        return results
+
+    async def requests(self, payload_items: int, concurrency: int) -> list[dict[str, Any]]:
+        server = MockGraphServer(payload_items, latency=self.latency)
+        graph_client = server.create_client()
+        results = []
+        for snippets in REQUEST_SNIPPETS:
+            for name, snippet in inspect.getmembers(snippets, inspect.isfunction):
+                if not name.startswith('make_'):
+                    continue
+                arguments = [SNIPPET_ARGUMENTS[parameter]
+                             for parameter in list(inspect.signature(snippet).parameters)[1:]]
+                results.append(await self._measure(
+                    f'{snippets.__name__}.{name}',
+                    lambda snippet=snippet, arguments=arguments: snippet(graph_client, *arguments),
+                    payload_items, concurrency))
+        return results
+
+    async def middleware(self, payload_items: int, concurrency: int) -> list[dict[str, Any]]:
+        results = []
+        for variant, chain in MIDDLEWARE_VARIANTS.items():
+            # Bodies come gzipped, as they do from Graph, so every chain pays
+            # for decompression either in httpx or in CompressionMiddleware
+            server = MockGraphServer(payload_items, latency=self.latency, compress=True)
+            handlers = chain()
+            graph_client = server.create_client(handlers)
+            result = await self._measure(
+                f'middleware.{variant}',
+                lambda graph_client=graph_client: BenchmarkSuite._get_raw(graph_client),
+                payload_items, concurrency)
+            for handler in handlers:
+                if isinstance(handler, CompressionMiddleware):
+                    result['bytes_saved'] = sum(
+                        route['bytes_received'] - route['bytes_received_compressed']
+                        for route in handler.snapshot())
+            results.append(result)
+
+        # Report each chain's cost relative to the default chain
+        default = next((result for result in results if result['name'] == 'middleware.default'
+                        and 'error' not in result), None)
+        if default is not None:
+            for result in results:
+                if 'error' not in result:
+                    result['p50_overhead_ms'] = result['p50_ms'] - default['p50_ms']
+        return results
+
+    async def credentials(self, concurrency: int) -> list[dict[str, Any]]:
+        # How long the event loop stalls while tokens refresh under load
+        results = []
+        for variant, wrap in CREDENTIAL_VARIANTS.items():
+            credential = MockCredential(TOKEN_LATENCY, lifetime=CREDENTIAL_REFRESH_OFFSET + 0.5)
+            graph_client = MockGraphServer(1, latency=self.latency).create_client(
+                credential=wrap(credential))
+
+            monitor = LoopStallMonitor()
+            monitor.start()
+            result = await self._measure(
+                f'credential.{variant}',
+                lambda graph_client=graph_client: BenchmarkSuite._get_raw(graph_client),
+                1, concurrency)
+            stalls = await monitor.stop()
+
+            result['max_stall_ms'] = stalls[-1] * 1000 if stalls else 0.0
+            result['p99_stall_ms'] = Benchmark.percentile(stalls, 99) * 1000
+            result['token_requests'] = credential.token_requests
+            results.append(result)
+        return results
+
+    async def check_credential_stall(
+        self, concurrency: int = 8, duration: float = 2.0) -> dict[str, float]:
+        # Raises AssertionError unless a sync credential on the event loop
+        # stalls it for the whole token latency, and the adapter keeps every
+        # stall under half of it. The token latency is well above the few
+        # milliseconds the requests themselves hold the loop for. Tokens are
+        # due for refresh every half second, so each credential refreshes
+        # several times in duration seconds
+        max_stalls = {}
+        for variant, wrap in CREDENTIAL_VARIANTS.items():
+            credential = MockCredential(STALL_CHECK_TOKEN_LATENCY,
+                                        lifetime=CREDENTIAL_REFRESH_OFFSET + 0.5)
+            # Without any service latency the requests never give the
+            # monitor a chance to run
+            graph_client = MockGraphServer(1, latency=max(self.latency, 0.001)).create_client(
+                credential=wrap(credential))
+            deadline = time.perf_counter() + duration
+
+            async def worker(
+                graph_client: GraphServiceClient = graph_client,
+                deadline: float = deadline) -> None:
+                while time.perf_counter() < deadline:
+                    await BenchmarkSuite._get_raw(graph_client)
+
+            monitor = LoopStallMonitor()
+            monitor.start()
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+            stalls = await monitor.stop()
+
+            if credential.token_requests < 2:
+                raise AssertionError(f'credential.{variant} never refreshed its token')
+            max_stalls[variant] = stalls[-1] if stalls else 0.0
+
+        if max_stalls['sync'] < STALL_CHECK_TOKEN_LATENCY:
+            raise AssertionError(f'The sync credential stalled the event loop for only '
+                                 f'{max_stalls["sync"] * 1000:.1f} ms, the monitor missed it')
+        if max_stalls['async-adapter'] >= STALL_CHECK_TOKEN_LATENCY / 2:
+            raise AssertionError(f'The adapter stalled the event loop for '
+                                 f'{max_stalls["async-adapter"] * 1000:.1f} ms')
+        return {variant: stall * 1000 for variant, stall in max_stalls.items()}
+
+    @staticmethod
+    async def _get_raw(graph_client: GraphServiceClient) -> bytes | None:
+        # GET /me/messages without deserializing the response, model parsing
+        # costs far more than any middleware and would hide the differences
+        request_info = graph_client.me.messages.to_get_request_information()
+        return await graph_client.request_adapter.send_primitive_async(request_info, 'bytes', {})
+
+    async def _measure(
+        self,
+        name: str,
+        operation: Callable[[], Awaitable[Any]],
+        payload_items: int,
+        concurrency: int) -> dict[str, Any]:
+        parameters = {'payload_items': payload_items}
+        try:
+            return await Benchmark.measure_async(
+                name, operation, self.iterations, concurrency, parameters)
+        except Exception as error: # pylint: disable=broad-exception-caught
+            return BenchmarkSuite._failed(name, {'concurrency': concurrency, **parameters}, error)
+
+    @staticmethod
+    def _failed(name: str, parameters: dict[str, Any], error: Exception) -> dict[str, Any]:
+        return {'name': name, 'parameters': parameters, 'error': repr(error)}
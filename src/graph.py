@@ -2,10 +2,13 @@
 # Licensed under the MIT License.
 
 from configparser import SectionProxy
+from azure.core.exceptions import ClientAuthenticationError
 from azure.identity import DeviceCodeCredential
 from msgraph.graph_service_client import GraphServiceClient
+from msgraph_core import NationalClouds
+from snippets.client_registry import ClientKey, DEFAULT_REGISTRY
+from snippets.token_cache import PersistentTokenCache, TokenRefresher
 
-# pylint: disable=too-few-public-methods
 class Graph:
     settings: SectionProxy
 
@@ -13,10 +16,59 @@ class Graph:
         self.settings = config
 
     def get_client_for_user(self) -> GraphServiceClient:
+        # One shared client, credential and connection pool per app registration
+        client = DEFAULT_REGISTRY.get_client(self._user_client_key(), self._create_user_credential)
+        return client
+
+    def start_token_refresh(self) -> TokenRefresher:
+        # Keeps the user's access token fresh in the background,
+        # call get_client_for_user first
+        credential = DEFAULT_REGISTRY.get_credential(self._user_client_key())
+        if credential is None:
+            raise RuntimeError('Call get_client_for_user before start_token_refresh')
+        refresher = TokenRefresher(credential, self.settings['graphUserScopes'].split(' '))
+        refresher.start()
+        return refresher
+
+    def _user_client_key(self) -> ClientKey:
         client_id = self.settings['clientId']
         tenant_id = self.settings['tenantId']
         graph_scopes = self.settings['graphUserScopes'].split(' ')
+        return ClientKey(tenant_id, client_id, tuple(graph_scopes), NationalClouds.Global.value)
 
-        credential = DeviceCodeCredential(client_id, tenant_id = tenant_id)
-        client = GraphServiceClient(credential, graph_scopes)
-        return client
+    def _create_user_credential(self) -> DeviceCodeCredential:
+        client_id = self.settings['clientId']
+        tenant_id = self.settings['tenantId']
+        graph_scopes = self.settings['graphUserScopes'].split(' ')
+        record_path = self.settings.get('authenticationRecordPath', 'auth_record.json')
+        allow_unencrypted = self.settings.getboolean('allowUnencryptedTokenCache', fallback=False)
+
+        # Tokens are persisted in an encrypted cache, so later runs
+        # sign in silently with the saved authentication record
+        record = PersistentTokenCache.load_authentication_record(record_path)
+        credential = DeviceCodeCredential(
+            client_id,
+            tenant_id = tenant_id,
+            cache_persistence_options=PersistentTokenCache.persistence_options(allow_unencrypted),
+            authentication_record=record)
+
+        if record is None:
+            # First run, prompt once and remember the account
+            try:
+                record = credential.authenticate(scopes=graph_scopes)
+            except (ClientAuthenticationError, ValueError) as error:
+                # azure.identity raises a ValueError, wrapped in a
+                # ClientAuthenticationError, before prompting when it can't
+                # encrypt the cache. For example on Linux without libsecret,
+                # over SSH or in a container
+                if not isinstance(error, ValueError) and \
+                        not isinstance(error.__cause__, ValueError):
+                    raise
+                credential.close()
+                print('The token cache can\'t be encrypted here, so tokens are only kept in '
+                      'memory for this run. Set allowUnencryptedTokenCache = true in '
+                      'config.cfg to store them unencrypted instead.')
+                return DeviceCodeCredential(client_id, tenant_id = tenant_id)
+            PersistentTokenCache.save_authentication_record(record, record_path)
+
+        return credential
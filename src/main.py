@@ -1,20 +1,84 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import argparse
 import asyncio
 import configparser
-from msgraph.generated.models.o_data_errors.o_data_error import ODataError
-from graph import Graph
-from snippets.create_requests import CreateRequests
+import json
+import os
+from benchmarks.harness import BenchmarkReport
+from snippets.lazy_import import LazyImport
+from snippets.startup_profiler import StartupProfiler
 
-async def main():
-    # Load settings
+# Loaded on first use, most runs never need every snippet module. graph and
+# client_registry pull in msgraph and azure.identity, which are most of the
+# startup time, so --help and --measure-startup don't load them at all
+graph = LazyImport.module('graph')
+client_registry = LazyImport.module('snippets.client_registry')
+create_requests = LazyImport.module('snippets.create_requests')
+large_file_upload = LazyImport.module('snippets.large_file_upload')
+load_generator = LazyImport.module('benchmarks.load_generator')
+mock_graph = LazyImport.module('benchmarks.mock_graph')
+
+# Modules in the order a run loads them, the first is needed before the menu shows
+STARTUP_MODULES = ['graph', 'snippets.create_requests', 'snippets.large_file_upload']
+
+def measure_startup(output: str | None) -> None:
+    results = StartupProfiler.measure(STARTUP_MODULES, os.path.dirname(os.path.abspath(__file__)))
+    for result in results:
+        print(f'{result["module"]}: {result["seconds"] * 1000:.0f} ms, '
+              f'{result["allocated_bytes"] / 1024 / 1024:.1f} MB allocated, '
+              f'{result["modules_loaded"]} modules')
+    if output:
+        with open(output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+
+def load_config() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
     config.read(['config.cfg', 'config.dev.cfg'])
+    return config
+
+async def run_load(load_args: argparse.Namespace) -> None:
+    # Headless load test, against the mock server with --stub or the
+    # signed-in user's tenant otherwise
+    options = load_generator.LoadOptions(load_args.concurrency, load_args.duration,
+                                         load_args.iterations, load_args.rps, load_args.open_loop)
+    if load_args.stub:
+        user_client = mock_graph.MockGraphServer(latency=load_args.latency).create_client()
+    else:
+        user_client = graph.Graph(load_config()['azure']).get_client_for_user()
+
+    cleanups: list = []
+    try:
+        operations = await load_generator.LoadGenerator.bind(
+            load_args.load, user_client, load_args.stub, cleanups)
+        results = await load_generator.LoadGenerator(operations, options).run()
+    finally:
+        # Deletes the items created for the run before the clients close
+        await load_generator.LoadGenerator.clean_up(cleanups)
+        await client_registry.DEFAULT_REGISTRY.aclose()
+
+    for result in results:
+        print(f'{result["name"]}: {result["iterations"]} ok, {result["errors"]} errors, '
+              f'p50 {result["p50_ms"]:.1f} ms, p99 {result["p99_ms"]:.1f} ms, '
+              f'{result["requests_per_second"]:.1f}/s')
+
+    output = load_args.output or 'load_report.json'
+    BenchmarkReport.save(results, output, vars(load_args))
+    print('Report saved to', output)
+
+async def main():
+    # Load settings
+    config = load_config()
     azure_settings = config['azure']
+    max_concurrency = config.getint('samples', 'maxConcurrency', fallback=4)
 
-    graph: Graph = Graph(azure_settings)
-    user_client = graph.get_client_for_user()
+    user_graph = graph.Graph(azure_settings)
+    user_client = user_graph.get_client_for_user()
+    token_refresher = user_graph.start_token_refresh()
+    # Finding the msgraph submodule imports msgraph itself, so this is only
+    # done once the client has loaded it anyway
+    o_data_error = LazyImport.module('msgraph.generated.models.o_data_errors.o_data_error')
 
     user = await user_client.me.get()
     if user:
@@ -26,6 +90,7 @@ async def main():
         print('Please choose one of the following options:')
         print('0. Exit')
         print('1. Run request samples')
+        print('2. Upload a large file attachment')
 
         try:
             choice = int(input())
@@ -36,13 +101,63 @@ async def main():
             if choice == 0:
                 print('Goodbye...')
             elif choice == 1:
-                await CreateRequests.run_all_samples(user_client)
+                report = await create_requests.CreateRequests.run_all_samples(
+                    user_client, max_concurrency)
+                print(report, '\n')
+            elif choice == 2:
+                file_path = config.get('large_file', 'largeFilePath').strip('\'"')
+                if await large_file_upload.LargeFileUpload.upload_to_draft(
+                        user_client, file_path):
+                    print('Uploaded', file_path, 'to a draft message, then deleted the draft\n')
+                else:
+                    print('Could not create an upload session\n')
             else:
                 print('Invalid choice!\n')
-        except ODataError as odata_error:
+        except o_data_error.ODataError as odata_error:
             print('Error:')
             if odata_error.error:
                 print(odata_error.error.code, odata_error.error.message)
+        except (OSError, ValueError) as error:
+            # For example a largeFilePath that doesn't point to a file
+            print('Error:', error, '\n')
+
+    # Stop refreshing tokens and close pooled connections
+    await token_refresher.stop()
+    await client_registry.DEFAULT_REGISTRY.aclose()
+
+parser = argparse.ArgumentParser(description='Microsoft Graph Python SDK snippets')
+parser.add_argument('--measure-startup', action='store_true',
+                    help='measure import time and memory of each module, then exit')
+parser.add_argument('--output', help='save --measure-startup or --load results as JSON')
+
+load_arguments = parser.add_argument_group('load test')
+load_arguments.add_argument('--load', nargs='+', metavar='METHOD',
+                            help='call snippet methods in a loop instead of showing the menu, '
+                                 'for example CreateRequests.make_read_request')
+load_length = load_arguments.add_mutually_exclusive_group()
+load_length.add_argument('--duration', type=float, help='seconds to run for')
+load_length.add_argument('--iterations', type=int, help='number of calls, the default is 100')
+load_arguments.add_argument('--concurrency', type=int, default=4,
+                            help='calls in flight at once')
+load_arguments.add_argument('--rps', type=float, help='target calls per second')
+load_arguments.add_argument('--open-loop', action='store_true',
+                            help='start calls on schedule instead of when a call finishes, '
+                                 'needs --rps')
+load_arguments.add_argument('--stub', action='store_true',
+                            help='send requests to an in-process mock of Microsoft Graph')
+load_arguments.add_argument('--latency', type=float, default=0.0,
+                            help='simulated latency of the --stub server in seconds')
+args = parser.parse_args()
 
-# Run main
-asyncio.run(main())
+if args.measure_startup:
+    measure_startup(args.output)
+elif args.load:
+    if args.duration is None and args.iterations is None:
+        args.iterations = 100
+    try:
+        asyncio.run(run_load(args))
+    except ValueError as error:
+        parser.error(str(error))
+else:
+    # Run main
+    asyncio.run(main())
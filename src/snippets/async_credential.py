@@ -0,0 +1,130 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import functools
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import TracebackType
+from typing import Any
+from azure.core.credentials import AccessToken, AccessTokenInfo, TokenRequestOptions
+from snippets.token_cache import CREDENTIAL_REFRESH_OFFSET
+
+# Tokens due for refresh are still handed out while they're valid for at
+# least this many seconds, so requests don't wait for the refresh
+EXPIRY_MARGIN = 60
+
+class AsyncCredentialAdapter:
+    requests: int
+    shared: int
+
+    def __init__(self, credential: Any, max_workers: int = 2) -> None:
+        # credential is a sync credential from azure.identity, for example
+        # DeviceCodeCredential, which has no azure.identity.aio version.
+        # Its token requests run on a small pool of worker threads, so a
+        # slow sign in or refresh doesn't stall the requests in flight
+        self._credential = credential
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='credential')
+        self._in_flight: dict[tuple, asyncio.Future[AccessTokenInfo]] = {}
+        self._tokens: dict[tuple, AccessTokenInfo] = {}
+        self.requests = 0
+        self.shared = 0
+
+    @staticmethod
+    def wrap(credential: Any) -> Any:
+        # Async credentials are returned as they are
+        get_token = getattr(credential, 'get_token', None)
+        if get_token is None or inspect.iscoroutinefunction(get_token):
+            return credential
+        return AsyncCredentialAdapter(credential)
+
+    async def get_token(
+        self,
+        *scopes: str,
+        claims: str | None = None,
+        tenant_id: str | None = None,
+        enable_cae: bool = False,
+        **kwargs: Any) -> AccessToken:
+        token = await self._acquire(
+            scopes, {**kwargs, 'claims': claims, 'tenant_id': tenant_id, 'enable_cae': enable_cae})
+        return AccessToken(token.token, token.expires_on)
+
+    async def get_token_info(
+        self, *scopes: str, options: TokenRequestOptions | None = None) -> AccessTokenInfo:
+        return await self._acquire(scopes, dict(options or {}))
+
+    async def _acquire(self, scopes: tuple[str, ...], options: dict[str, Any]) -> AccessTokenInfo:
+        # Unset options are dropped, so Kiota's get_token(enable_cae=True)
+        # and TokenRefresher's get_token_info(options={'enable_cae': True})
+        # share a token. Concurrent requests for the same scopes and options
+        # share one call to the credential. A claims challenge always needs
+        # a new token
+        options = {name: value for name, value in options.items() if value}
+        key = (scopes, tuple(sorted(options.items())))
+        token = self._tokens.get(key) if 'claims' not in options else None
+        if token is not None and not AsyncCredentialAdapter._refresh_due(token):
+            return token
+
+        future = self._in_flight.get(key)
+        if future is None:
+            self.requests += 1
+            future = self._in_flight[key] = asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(self._call, scopes, options))
+            future.add_done_callback(functools.partial(self._refreshed, key, 'claims' in options))
+        else:
+            self.shared += 1
+
+        if token is not None and token.expires_on - time.time() > EXPIRY_MARGIN:
+            # Still valid, requests keep using it while the refresh runs
+            return token
+        # Shielded, so a cancelled request doesn't fail the others waiting
+        return await asyncio.shield(future)
+
+    def _refreshed(
+        self, key: tuple, challenged: bool, future: asyncio.Future[AccessTokenInfo]) -> None:
+        del self._in_flight[key]
+        if future.cancelled():
+            return
+        # Retrieved here, so a failed background refresh isn't logged as
+        # unhandled. The next request past refresh time tries again
+        if future.exception() is None and not challenged:
+            self._tokens[key] = future.result()
+
+    def _call(self, scopes: tuple[str, ...], options: dict[str, Any]) -> AccessTokenInfo:
+        # Runs on a worker thread
+        get_token_info = getattr(self._credential, 'get_token_info', None)
+        if get_token_info is not None:
+            return get_token_info(*scopes, options=TokenRequestOptions(**options) or None)
+        token = self._credential.get_token(*scopes, **options)
+        return AccessTokenInfo(token.token, token.expires_on)
+
+    @staticmethod
+    def _refresh_due(token: AccessTokenInfo) -> bool:
+        # The same rule azure.identity uses for its own cache
+        now = time.time()
+        return token.expires_on - now < CREDENTIAL_REFRESH_OFFSET or \
+            (token.refresh_on is not None and token.refresh_on <= now)
+
+    async def close(self) -> None:
+        # The Azure Identity authentication provider closes async credentials
+        # after every token, so this keeps the worker threads and tokens
+        pass
+
+    async def aclose(self) -> None:
+        # Stops the worker threads and closes the wrapped credential
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._tokens.clear()
+        close = getattr(self._credential, 'close', None)
+        if close is not None:
+            close()
+
+    async def __aenter__(self) -> 'AsyncCredentialAdapter':
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None = None,
+        exc_value: BaseException | None = None,
+        traceback: TracebackType | None = None) -> None:
+        await self.aclose()
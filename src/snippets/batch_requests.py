@@ -0,0 +1,236 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import base64
+import json
+from typing import Any
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from kiota_abstractions.method import Method
+from kiota_abstractions.request_information import RequestInformation
+from kiota_abstractions.serialization.parsable_factory import ParsableFactory
+from kiota_abstractions.serialization.parse_node_factory_registry import (
+    ParseNodeFactoryRegistry)
+from msgraph.generated.users.item.user_item_request_builder import UserItemRequestBuilder
+from msgraph.generated.users.item.messages.messages_request_builder import MessagesRequestBuilder
+from msgraph.generated.models.user import User
+from msgraph.generated.models.message_collection_response import MessageCollectionResponse
+from msgraph.generated.models.event_collection_response import EventCollectionResponse
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph_core.requests.batch_request_item import BatchRequestItem
+
+# Graph rejects $batch payloads with more than 20 sub-requests
+MAX_BATCH_SIZE = 20
+
+# Returned for a sub-request that was not sent because a request it depends on failed
+FAILED_DEPENDENCY = 424
+
+# pylint: disable=too-few-public-methods
+class BatchItemResult:
+    request_id: str
+    status: int
+    headers: dict[str, str]
+    value: Any
+    error: ODataError | None
+
+    def __init__(
+        self,
+        request_id: str,
+        status: int,
+        headers: dict[str, str] | None = None,
+        value: Any = None,
+        error: ODataError | None = None) -> None:
+        self.request_id = request_id
+        self.status = status
+        self.headers = headers or {}
+        self.value = value
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        return 200 <= self.status < 300
+
+class _PendingRequest:
+    def __init__(
+        self,
+        item: BatchRequestItem,
+        response_type: ParsableFactory | None,
+        depends_on: list[str]) -> None:
+        self.item = item
+        self.response_type = response_type
+        self.depends_on = depends_on
+
+class RequestBatch:
+    def __init__(self, graph_client: GraphServiceClient) -> None:
+        self._graph_client = graph_client
+        self._requests: dict[str, _PendingRequest] = {}
+
+    def add(
+        self,
+        request_info: RequestInformation,
+        response_type: ParsableFactory | None = None,
+        depends_on: list[str] | None = None,
+        request_id: str | None = None) -> str:
+        # Dependencies must already be in the batch, so the graph can't contain cycles
+        request_id = request_id or str(len(self._requests) + 1)
+        if request_id in self._requests:
+            raise ValueError(f'Request {request_id} is already in the batch')
+        for dependency in depends_on or []:
+            if dependency not in self._requests:
+                raise ValueError(f'Request {request_id} depends on unknown request {dependency}')
+
+        item = BatchRequestItem(request_info, id=request_id, depends_on=None)
+        self._requests[request_id] = _PendingRequest(
+            item, response_type, list(depends_on or []))
+        return request_id
+
+    def pack(self) -> list[list[str]]:
+        # Requests are packed in insertion order, which is a topological order,
+        # so every dependency lands in the same or an earlier batch
+        batches: list[list[str]] = []
+        for request_id in self._requests:
+            if not batches or len(batches[-1]) >= MAX_BATCH_SIZE:
+                batches.append([])
+            batches[-1].append(request_id)
+        return batches
+
+    async def execute(self) -> dict[str, BatchItemResult]:
+        batches = self.pack()
+        results: dict[str, BatchItemResult] = {}
+        batch_of = {request_id: index
+                    for index, batch in enumerate(batches) for request_id in batch}
+        done = [asyncio.Event() for _ in batches]
+
+        async def run_batch(index: int) -> None:
+            # Wait only for the earlier batches this one actually depends on
+            for prerequisite in sorted({batch_of[dependency]
+                                        for request_id in batches[index]
+                                        for dependency in self._requests[request_id].depends_on
+                                        if batch_of[dependency] != index}):
+                await done[prerequisite].wait()
+            try:
+                await self._post_batch(batches[index], results)
+            finally:
+                done[index].set()
+
+        await asyncio.gather(*(run_batch(index) for index in range(len(batches))))
+        return results
+
+    async def _post_batch(
+        self, request_ids: list[str], results: dict[str, BatchItemResult]) -> None:
+        payload_requests: list[dict[str, Any]] = []
+        sent: set[str] = set()
+        for request_id in request_ids:
+            pending = self._requests[request_id]
+
+            # Don't send requests whose dependencies failed, the same way
+            # Graph handles a failed dependsOn inside a single batch
+            if any(dependency not in sent and (dependency not in results
+                                               or not results[dependency].succeeded)
+                   for dependency in pending.depends_on):
+                results[request_id] = BatchItemResult(request_id, FAILED_DEPENDENCY)
+                continue
+
+            payload_requests.append(RequestBatch._serialize_item(
+                pending.item, [dependency for dependency in pending.depends_on
+                               if dependency in sent]))
+            sent.add(request_id)
+
+        if not payload_requests:
+            return
+
+        request_info = RequestInformation(Method.POST, '{+baseurl}/$batch', {})
+        request_info.headers.try_add('Accept', 'application/json')
+        request_info.set_stream_content(
+            json.dumps({'requests': payload_requests}).encode('utf-8'), 'application/json')
+
+        content = await self._graph_client.request_adapter.send_primitive_async(
+            request_info, 'bytes', {'XXX': ODataError})
+        responses = json.loads(content or b'{}').get('responses', [])
+
+        for response in responses:
+            request_id = response.get('id')
+            if request_id in sent:
+                results[request_id] = self._deserialize_response(
+                    response, self._requests[request_id].response_type)
+
+    @staticmethod
+    def _serialize_item(item: BatchRequestItem, depends_on: list[str]) -> dict[str, Any]:
+        request: dict[str, Any] = {
+            'id': item.id,
+            'method': item.method,
+            'url': item.url
+        }
+        if item.headers:
+            request['headers'] = item.headers
+        if item.body:
+            content_type = next((value for name, value in (item.headers or {}).items()
+                                 if name.lower() == 'content-type'), '')
+            if content_type.startswith('application/json'):
+                request['body'] = json.loads(item.body)
+            else:
+                request['body'] = base64.b64encode(item.body).decode('ascii')
+        if depends_on:
+            request['dependsOn'] = depends_on
+        return request
+
+    @staticmethod
+    def _deserialize_response(
+        response: dict[str, Any], response_type: ParsableFactory | None) -> BatchItemResult:
+        request_id = response['id']
+        status = int(response.get('status', 0))
+        headers = response.get('headers') or {}
+        body = response.get('body')
+        result = BatchItemResult(request_id, status, headers)
+        if body is None:
+            return result
+
+        content_type = next((value for name, value in headers.items()
+                             if name.lower() == 'content-type'), 'application/json')
+        if not content_type.startswith('application/json'):
+            # Graph base64-encodes non-JSON sub-response bodies
+            result.value = base64.b64decode(body) if isinstance(body, str) else body
+            return result
+
+        parse_node = ParseNodeFactoryRegistry().get_root_parse_node(
+            'application/json', json.dumps(body).encode('utf-8'))
+        if not result.succeeded:
+            result.error = parse_node.get_object_value(ODataError)
+            result.error.response_status_code = status
+        elif response_type is not None:
+            result.value = parse_node.get_object_value(response_type)
+        return result
+
+class BatchRequests:
+    @staticmethod
+    async def make_batch_request(graph_client: GraphServiceClient) -> dict[str, BatchItemResult]:
+        # The same requests as make_read_request, make_select_request,
+        # make_list_request and make_headers_request, sent in a single POST
+        batch = RequestBatch(graph_client)
+
+        batch.add(graph_client.me.to_get_request_information(), User, request_id='read')
+
+        select_config = RequestConfiguration(
+            query_parameters=UserItemRequestBuilder.UserItemRequestBuilderGetQueryParameters(
+                select=['displayName', 'jobTitle']
+            )
+        )
+        batch.add(graph_client.me.to_get_request_information(select_config), User,
+                  request_id='select')
+
+        list_config = RequestConfiguration(
+            query_parameters=MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+                select=['subject', 'sender'],
+                filter='subject eq \'Hello world\''
+            )
+        )
+        batch.add(graph_client.me.messages.to_get_request_information(list_config),
+                  MessageCollectionResponse, request_id='list')
+
+        headers_config = RequestConfiguration()
+        headers_config.headers.add('Prefer', 'outlook.timezone="Pacific Standard Time"')
+        batch.add(graph_client.me.events.to_get_request_information(headers_config),
+                  EventCollectionResponse, request_id='headers')
+
+        return await batch.execute()
@@ -0,0 +1,228 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+from kiota_abstractions.method import Method
+from kiota_abstractions.request_information import RequestInformation
+from kiota_abstractions.serialization.parsable_factory import ParsableFactory
+from msgraph.generated.models.calendar import Calendar
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.graph_service_client import GraphServiceClient
+from snippets.batch_requests import MAX_BATCH_SIZE, BatchItemResult, RequestBatch
+
+# Sub-request statuses that are retried. Only 429 is retried for POST,
+# the other statuses don't say whether the item was created
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_STATUSES_POST = {429}
+
+# pylint: disable=too-few-public-methods
+class BulkOperation:
+    def __init__(
+        self,
+        request_info: RequestInformation,
+        response_type: ParsableFactory | None = None,
+        key: Any = None) -> None:
+        # request_info comes from a request builder's to_post_request_information,
+        # to_patch_request_information or to_delete_request_information.
+        # key is anything that identifies the item to the caller
+        self.request_info = request_info
+        self.response_type = response_type
+        self.key = key
+
+class BulkResult:
+    def __init__(
+        self,
+        operation: BulkOperation,
+        result: BatchItemResult | None,
+        attempts: int,
+        error: BaseException | None = None) -> None:
+        # result is None when the whole $batch request failed, error says why
+        self.operation = operation
+        self.status = result.status if result is not None else 0
+        self.value = result.value if result is not None else None
+        self.error = result.error if result is not None else error
+        self.attempts = attempts
+
+    @property
+    def succeeded(self) -> bool:
+        if 200 <= self.status < 300:
+            return True
+        # A retried delete can find the item already gone, when an earlier
+        # attempt deleted it but its response was lost
+        return self.status == 404 and self.attempts > 1 and \
+            self.operation.request_info.http_method == Method.DELETE
+
+class BulkWriter:
+    def __init__(
+        self,
+        graph_client: GraphServiceClient,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        retry_delay: float = 1.0) -> None:
+        # Up to max_concurrency $batch requests are in flight at once. Failed
+        # sub-requests are retried max_retries times, waiting as long as
+        # Graph's Retry-After says, or retry_delay seconds doubled on each attempt
+        self._graph_client = graph_client
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+
+    async def run(
+        self,
+        operations: Iterable[BulkOperation] | AsyncIterable[BulkOperation]
+        ) -> AsyncIterator[BulkResult]:
+        # Yields one result per operation as its batch completes, so results
+        # arrive out of order. Operations are read as batches free up, so
+        # a long stream of them is never all in memory
+        chunks: asyncio.Queue[list[BulkOperation] | None] = asyncio.Queue(self._max_concurrency)
+        results: asyncio.Queue[BulkResult | None] = asyncio.Queue(
+            self._max_concurrency * MAX_BATCH_SIZE)
+
+        async def produce() -> None:
+            chunk: list[BulkOperation] = []
+            try:
+                async for operation in BulkWriter._iterate(operations):
+                    chunk.append(operation)
+                    if len(chunk) == MAX_BATCH_SIZE:
+                        await chunks.put(chunk)
+                        chunk = []
+            finally:
+                # Operations already read are written even if the stream fails
+                if chunk:
+                    await chunks.put(chunk)
+                for _ in range(self._max_concurrency):
+                    await chunks.put(None)
+
+        async def work() -> None:
+            while (chunk := await chunks.get()) is not None:
+                await self._write_chunk(chunk, results.put)
+
+        async def run_all() -> None:
+            try:
+                outcomes = await asyncio.gather(
+                    produce(), *[work() for _ in range(self._max_concurrency)],
+                    return_exceptions=True)
+            finally:
+                await results.put(None)
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+
+        runner = asyncio.create_task(run_all())
+        try:
+            while (result := await results.get()) is not None:
+                yield result
+            # Raises an error from the operations iterable
+            await runner
+        finally:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+    async def _write_chunk(
+        self,
+        chunk: list[BulkOperation],
+        emit: Callable[[BulkResult], Awaitable[None]]) -> None:
+        pending = dict(enumerate(chunk))
+        attempts = 0
+        while pending:
+            attempts += 1
+            batch = RequestBatch(self._graph_client)
+            for index, operation in pending.items():
+                batch.add(operation.request_info, operation.response_type, request_id=str(index))
+
+            batch_error: BaseException | None = None
+            try:
+                results = await batch.execute()
+            except Exception as error: # pylint: disable=broad-exception-caught
+                results = {}
+                batch_error = error
+
+            retry: dict[int, BulkOperation] = {}
+            retry_after: list[float] = []
+            for index, operation in pending.items():
+                result = results.get(str(index))
+                status = result.status if result is not None else \
+                    BulkWriter._batch_error_status(batch_error)
+                if attempts <= self._max_retries and BulkWriter._retryable(operation, status):
+                    retry[index] = operation
+                    retry_after.extend(BulkWriter._retry_after(result))
+                else:
+                    await emit(BulkResult(operation, result, attempts, batch_error))
+
+            # Only the sub-requests that failed are sent again, as soon as
+            # Graph says they can be
+            pending = retry
+            if pending:
+                await asyncio.sleep(max(retry_after) if retry_after
+                                    else self._retry_delay * 2 ** (attempts - 1))
+
+    @staticmethod
+    def _retryable(operation: BulkOperation, status: int) -> bool:
+        if operation.request_info.http_method == Method.POST:
+            return status in RETRY_STATUSES_POST
+        return status in RETRY_STATUSES
+
+    @staticmethod
+    def _batch_error_status(error: BaseException | None) -> int:
+        # A failed $batch request fails all of its sub-requests the same way.
+        # Connection errors count as 503, nothing is known to have happened
+        if isinstance(error, ODataError):
+            return error.response_status_code or 0
+        return 503
+
+    @staticmethod
+    def _retry_after(result: BatchItemResult | None) -> list[float]:
+        # Graph sends Retry-After in seconds on throttled sub-requests
+        value = next((value for name, value in result.headers.items()
+                      if name.lower() == 'retry-after'), None) if result is not None else None
+        try:
+            return [float(value)] if value is not None else []
+        except ValueError:
+            return []
+
+    @staticmethod
+    async def _iterate(
+        operations: Iterable[BulkOperation] | AsyncIterable[BulkOperation]
+        ) -> AsyncIterator[BulkOperation]:
+        if isinstance(operations, AsyncIterable):
+            async for operation in operations:
+                yield operation
+        else:
+            for operation in operations:
+                yield operation
+
+class BulkWrites:
+    @staticmethod
+    async def delete_messages(
+        graph_client: GraphServiceClient, message_ids: Iterable[str]) -> list[str]:
+        # DELETE https://graph.microsoft.com/v1.0/me/messages/{message-id}
+        # for every message, 20 to a $batch request. Returns the ids that
+        # could not be deleted
+        operations = (BulkOperation(
+            graph_client.me.messages.by_message_id(message_id).to_delete_request_information(),
+            key=message_id) for message_id in message_ids)
+
+        failed = []
+        async for result in BulkWriter(graph_client).run(operations):
+            if not result.succeeded:
+                failed.append(result.operation.key)
+        return failed
+
+    @staticmethod
+    async def create_calendars(
+        graph_client: GraphServiceClient, names: list[str]) -> dict[str, Calendar | None]:
+        # POST https://graph.microsoft.com/v1.0/me/calendars for every name.
+        # Maps each name to its new calendar, or None if it wasn't created
+        operations = []
+        for name in names:
+            calendar = Calendar()
+            calendar.name = name
+            operations.append(BulkOperation(
+                graph_client.me.calendars.to_post_request_information(calendar),
+                Calendar, key=name))
+
+        calendars: dict[str, Calendar | None] = {}
+        async for result in BulkWriter(graph_client).run(operations):
+            calendars[result.operation.key] = result.value if result.succeeded else None
+        return calendars
@@ -0,0 +1,217 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import heapq
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncGenerator, AsyncIterator
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from msgraph.generated.models.event import Event
+from msgraph.generated.users.item.calendar_view.calendar_view_request_builder import (
+    CalendarViewRequestBuilder)
+from msgraph.graph_service_client import GraphServiceClient
+
+# pylint: disable=too-few-public-methods
+class RangeQueryOptions:
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        page_size: int = 100,
+        initial_window: timedelta | None = None,
+        min_window: timedelta = timedelta(hours=1),
+        max_window: timedelta = timedelta(days=31)) -> None:
+        # max_concurrency caps the calendarView requests in flight across
+        # all calendars. Windows are sized to hold about page_size events,
+        # so most of them are fetched with a single request. Without an
+        # initial_window, the range starts out split into max_concurrency windows
+        if min_window > max_window:
+            raise ValueError('min_window must not be longer than max_window')
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+        self.initial_window = initial_window
+        self.min_window = min_window
+        self.max_window = max_window
+
+# pylint: disable=too-many-instance-attributes
+class CalendarRangeQuery:
+    windows_fetched: int
+    windows_split: int
+
+    def __init__(
+        self,
+        request_builders: list[Any],
+        start: datetime,
+        end: datetime,
+        options: RangeQueryOptions | None = None,
+        select: list[str] | None = None) -> None:
+        # request_builders are calendarView request builders, for example
+        # graph_client.me.calendar_view or
+        # graph_client.me.calendars.by_calendar_id(calendar_id).calendar_view.
+        # Times without a time zone are taken as UTC
+        self._request_builders = request_builders
+        self._start = CalendarRangeQuery._as_utc(start)
+        self._end = CalendarRangeQuery._as_utc(end)
+        self._options = options or RangeQueryOptions()
+        # Events are ordered and split up by their start time
+        self._select = select if select is None or 'start' in select else [*select, 'start']
+        self._requests = asyncio.Semaphore(self._options.max_concurrency)
+        self.windows_fetched = 0
+        self.windows_split = 0
+
+    def __aiter__(self) -> AsyncIterator[Event]:
+        return self.run()
+
+    async def run(self) -> AsyncIterator[Event]:
+        # Yields the events of all calendars ordered by start time. Each
+        # calendar's events already arrive in order, so they're merged as
+        # they come instead of being collected and sorted
+        streams = [self._calendar_events(builder) for builder in self._request_builders]
+        heads: list[tuple[datetime, int, Event]] = []
+
+        async def advance(index: int) -> None:
+            event = await anext(streams[index], None)
+            if event is not None:
+                heapq.heappush(heads, (CalendarRangeQuery._start_of(event), index, event))
+
+        try:
+            await asyncio.gather(*[advance(index) for index in range(len(streams))])
+            while heads:
+                _, index, event = heapq.heappop(heads)
+                yield event
+                await advance(index)
+        finally:
+            for stream in streams:
+                await stream.aclose()
+
+    async def _calendar_events(self, request_builder: Any) -> AsyncGenerator[Event, None]:
+        # Windows are fetched ahead while earlier ones are being read. Each
+        # window is sized from how many events the previous one held
+        windows: deque[tuple[asyncio.Task[list[Event]], timedelta]] = deque()
+        cursor = self._start
+        options = self._options
+        size = options.initial_window or (self._end - self._start) / options.max_concurrency
+        size = max(options.min_window, min(options.max_window, size))
+        try:
+            while windows or cursor < self._end:
+                while cursor < self._end and len(windows) < options.max_concurrency:
+                    window_end = min(cursor + size, self._end)
+                    windows.append((asyncio.create_task(self._fetch_window(
+                        request_builder, cursor, window_end, cursor == self._start)),
+                        window_end - cursor))
+                    cursor = window_end
+
+                task, length = windows.popleft()
+                events = await task
+                size = self._next_window_size(length, len(events))
+                for event in events:
+                    yield event
+        finally:
+            for task, _ in windows:
+                task.cancel()
+            await asyncio.gather(*[task for task, _ in windows], return_exceptions=True)
+
+    def _next_window_size(self, length: timedelta, count: int) -> timedelta:
+        options = self._options
+        if count == 0:
+            return options.max_window
+        size = length * (options.page_size / count)
+        return max(options.min_window, min(options.max_window, size))
+
+    async def _fetch_window(
+        self,
+        request_builder: Any,
+        start: datetime,
+        end: datetime,
+        first: bool) -> list[Event]:
+        # A window returns every event that overlaps it, so an event that
+        # crosses a boundary comes back from both windows. Each event is
+        # only kept by the window it starts in, and the first window also
+        # keeps events that started before the range
+        self.windows_fetched += 1
+        page = await self._get(request_builder, start, end)
+        events: list[Event] = (page.value or []) if page is not None else []
+        next_link = page.odata_next_link if page is not None else None
+
+        if next_link:
+            last = CalendarRangeQuery._start_of(events[-1]) if events else start
+            if last > start and end - last >= 2 * self._options.min_window:
+                # Too dense for one page. Rather than page through the rest
+                # one request after another, fetch it as two sub-windows at once
+                self.windows_split += 1
+                middle = last + (end - last) / 2
+                kept = [event for event in events if CalendarRangeQuery._start_of(event) < last]
+                rest = await asyncio.gather(
+                    self._fetch_window(request_builder, last, middle, False),
+                    self._fetch_window(request_builder, middle, end, False))
+                return self._owned(kept, start, end, first) + rest[0] + rest[1]
+
+            # Too narrow to split, or every event on the page starts at once
+            while next_link:
+                async with self._requests:
+                    page = await request_builder.with_url(next_link).get()
+                events.extend((page.value or []) if page is not None else [])
+                next_link = page.odata_next_link if page is not None else None
+
+        return self._owned(events, start, end, first)
+
+    async def _get(self, request_builder: Any, start: datetime, end: datetime) -> Any:
+        # GET .../calendarView?startDateTime={start}&endDateTime={end}
+        #   &$orderby=start/dateTime&$top={page_size}
+        # Every calendarView request builder takes the same query parameters
+        query_params = CalendarViewRequestBuilder.CalendarViewRequestBuilderGetQueryParameters(
+            start_date_time=start.isoformat().replace('+00:00', 'Z'),
+            end_date_time=end.isoformat().replace('+00:00', 'Z'),
+            orderby=['start/dateTime'],
+            top=self._options.page_size,
+            select=self._select)
+
+        async with self._requests:
+            return await request_builder.get(RequestConfiguration(query_parameters=query_params))
+
+    @staticmethod
+    def _owned(events: list[Event], start: datetime, end: datetime, first: bool) -> list[Event]:
+        return [event for event in events
+                if (first or CalendarRangeQuery._start_of(event) >= start)
+                and CalendarRangeQuery._start_of(event) < end]
+
+    @staticmethod
+    def _start_of(event: Event) -> datetime:
+        # Without a Prefer: outlook.timezone header Graph returns times in UTC
+        value = event.start.date_time if event.start is not None else None
+        if not value:
+            return datetime.min.replace(tzinfo=timezone.utc)
+        # Graph sends seven fractional digits, before Python 3.11
+        # fromisoformat only accepts three or six, and no Z suffix
+        date_time, _, fraction = value.replace('Z', '+00:00').partition('.')
+        if fraction:
+            digits = len(fraction) - len(fraction.lstrip('0123456789'))
+            date_time += '.' + fraction[:digits][:6].ljust(6, '0') + fraction[digits:]
+        return CalendarRangeQuery._as_utc(datetime.fromisoformat(date_time))
+
+    @staticmethod
+    def _as_utc(value: datetime) -> datetime:
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+# pylint: disable=too-few-public-methods
+class CalendarRanges:
+    @staticmethod
+    async def list_events_across_calendars(
+        graph_client: GraphServiceClient,
+        calendar_ids: list[str],
+        start: datetime,
+        end: datetime) -> int:
+        # GET https://graph.microsoft.com/v1.0/me/calendars/{calendar-id}/calendarView
+        # for every calendar, split into windows that are fetched at the same time
+        request_builders = [graph_client.me.calendars.by_calendar_id(calendar_id).calendar_view
+                            for calendar_id in calendar_ids]
+
+        count = 0
+        async for event in CalendarRangeQuery(
+                request_builders, start, end, select=['subject', 'start', 'end']):
+            print(event.subject)
+            count += 1
+
+        return count
@@ -0,0 +1,433 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qs, urlsplit
+import httpx
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.generated.models.subscription import Subscription
+from msgraph.graph_service_client import GraphServiceClient
+
+# Longest lifetime Graph allows for Outlook message and event subscriptions
+MAX_OUTLOOK_LIFETIME = timedelta(minutes=4230)
+
+# Graph stops delivering to endpoints that take longer than this to respond
+RESPONSE_DEADLINE = 3.0
+
+# Headers are bounded by the stream reader's 64 KiB limit
+MAX_BODY_BYTES = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Receives a batch of notifications, in the order they arrived
+BatchHandler = Callable[[list[dict[str, Any]]], Awaitable[None]]
+
+# pylint: disable=too-many-instance-attributes
+class SubscriptionManager:
+    renewals: int
+    recreations: int
+    failures: int
+
+    def __init__(
+        self,
+        graph_client: GraphServiceClient,
+        notification_url: str,
+        client_state: str | None = None,
+        renew_before: timedelta = timedelta(minutes=30),
+        retry_delay: float = 60.0) -> None:
+        # notification_url must be HTTPS and reachable from Graph, for
+        # example a tunnel to WebhookReceiver. Lifecycle notifications are
+        # sent there too. Subscriptions are renewed renew_before they expire
+        self._graph_client = graph_client
+        self.notification_url = notification_url
+        self.client_state = client_state or secrets.token_urlsafe(32)
+        self._renew_before = renew_before
+        self._retry_delay = retry_delay
+        self._subscriptions: dict[str, Subscription] = {}
+        self._lifetimes: dict[str, timedelta] = {}
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+        self.renewals = 0
+        self.recreations = 0
+        self.failures = 0
+
+    @property
+    def subscriptions(self) -> list[Subscription]:
+        return list(self._subscriptions.values())
+
+    async def subscribe(
+        self,
+        resource: str,
+        change_type: str,
+        lifetime: timedelta = MAX_OUTLOOK_LIFETIME) -> Subscription:
+        # POST https://graph.microsoft.com/v1.0/subscriptions
+        # change_type is a comma-separated list, for example 'created,updated'
+        request_body = Subscription()
+        request_body.change_type = change_type
+        request_body.notification_url = self.notification_url
+        request_body.lifecycle_notification_url = self.notification_url
+        request_body.resource = resource
+        request_body.expiration_date_time = datetime.now(timezone.utc) + lifetime
+        request_body.client_state = self.client_state
+
+        subscription = await self._graph_client.subscriptions.post(request_body)
+        if not subscription or not subscription.id:
+            raise RuntimeError(f'Could not subscribe to {resource}')
+
+        self._subscriptions[subscription.id] = subscription
+        self._lifetimes[subscription.id] = lifetime
+        self._wake.set()
+        return subscription
+
+    async def renew(self, subscription_id: str) -> Subscription:
+        # PATCH https://graph.microsoft.com/v1.0/subscriptions/{subscription-id}
+        # A subscription Graph has already removed is created again
+        subscription = self._subscriptions[subscription_id]
+        request_body = Subscription()
+        request_body.expiration_date_time = \
+            datetime.now(timezone.utc) + self._lifetimes[subscription_id]
+
+        try:
+            renewed = await self._graph_client.subscriptions.by_subscription_id(
+                subscription_id).patch(request_body)
+        except ODataError as error:
+            if error.response_status_code != 404:
+                raise
+            return await self._recreate(subscription_id)
+
+        subscription.expiration_date_time = \
+            renewed.expiration_date_time if renewed else request_body.expiration_date_time
+        self.renewals += 1
+        return subscription
+
+    async def handle_lifecycle(self, notification: dict[str, Any]) -> None:
+        # Pass lifecycle notifications here, see WebhookReceiver
+        subscription_id = notification.get('subscriptionId', '')
+        if subscription_id not in self._subscriptions:
+            return
+        event = notification.get('lifecycleEvent')
+        if event == 'reauthorizationRequired':
+            await self.renew(subscription_id)
+        elif event == 'subscriptionRemoved':
+            await self._recreate(subscription_id)
+        # 'missed' means notifications were dropped, only a sync catches up,
+        # for example DeltaSync
+
+    def start(self) -> None:
+        # Renews subscriptions in the background until stop() is called
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, delete: bool = False) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        if delete:
+            # DELETE https://graph.microsoft.com/v1.0/subscriptions/{subscription-id}
+            for subscription_id in list(self._subscriptions):
+                await self._graph_client.subscriptions.by_subscription_id(
+                    subscription_id).delete()
+                self._forget(subscription_id)
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            now = datetime.now(timezone.utc)
+            due = [subscription_id for subscription_id, subscription
+                   in self._subscriptions.items()
+                   if SubscriptionManager._expires(subscription) - self._renew_before <= now]
+            delay = None
+            for subscription_id in due:
+                try:
+                    await self.renew(subscription_id)
+                except Exception: # pylint: disable=broad-exception-caught
+                    # Try again soon, the subscription is still active until it expires
+                    self.failures += 1
+                    delay = self._retry_delay
+
+            if delay is None:
+                delay = self._seconds_until_next_renewal()
+            try:
+                # Woken early when a new subscription is added
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _seconds_until_next_renewal(self) -> float | None:
+        if not self._subscriptions:
+            return None
+        next_renewal = min(SubscriptionManager._expires(subscription)
+                           for subscription in self._subscriptions.values()) - self._renew_before
+        return max((next_renewal - datetime.now(timezone.utc)).total_seconds(), 1.0)
+
+    async def _recreate(self, subscription_id: str) -> Subscription:
+        # The old subscription is only forgotten once its replacement exists,
+        # so a failure is retried on the next renewal
+        previous = self._subscriptions[subscription_id]
+        subscription = await self.subscribe(previous.resource or '', previous.change_type or '',
+                                             self._lifetimes[subscription_id])
+        self._forget(subscription_id)
+        self.recreations += 1
+        return subscription
+
+    def _forget(self, subscription_id: str) -> None:
+        self._subscriptions.pop(subscription_id, None)
+        self._lifetimes.pop(subscription_id, None)
+
+    @staticmethod
+    def _expires(subscription: Subscription) -> datetime:
+        return subscription.expiration_date_time or datetime.now(timezone.utc)
+
+# pylint: disable=too-few-public-methods
+class ReceiverOptions:
+    def __init__(
+        self,
+        queue_size: int = 1000,
+        batch_size: int = 50,
+        batch_delay: float = 0.5) -> None:
+        # Batches hold up to batch_size notifications, waiting at most
+        # batch_delay seconds to fill. When queue_size notifications are
+        # waiting, new deliveries get a 503 and Graph sends them again later
+        if queue_size < 1:
+            raise ValueError('queue_size must be at least 1')
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+
+# pylint: disable=too-many-instance-attributes
+class WebhookReceiver:
+    received: int
+    rejected: int
+    invalid: int
+    processed: int
+    batches: int
+    failed_batches: int
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        client_state: str | None = None,
+        options: ReceiverOptions | None = None,
+        lifecycle_handler: Callable[[dict[str, Any]], Awaitable[None]] | None = None) -> None:
+        # handler gets the notifications in batches. Notifications whose
+        # clientState doesn't match client_state are dropped. Lifecycle
+        # notifications go to lifecycle_handler instead, for example
+        # SubscriptionManager.handle_lifecycle
+        self._handler = handler
+        self._client_state = client_state
+        self._options = options or ReceiverOptions()
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(self._options.queue_size)
+        self._lifecycle_handler = lifecycle_handler
+        self._server: asyncio.Server | None = None
+        self._consumer: asyncio.Task | None = None
+        self._lifecycle_tasks: set[asyncio.Task] = set()
+        self.received = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.processed = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError('The receiver is not running')
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}/notifications'
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        # Port 0 picks a free port, see url
+        self._server = await asyncio.start_server(self._serve, host, port)
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self, drain: bool = True) -> None:
+        # With drain, notifications already accepted are processed first
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if drain:
+            await self._queue.join()
+        if self._consumer is not None:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+            self._consumer = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await WebhookReceiver._read_request(reader)
+                if request is None:
+                    break
+                status, content_type, body = await self._respond(*request)
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                    f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes] | None:
+        # Just enough HTTP/1.1 for Graph's POSTs: a request line, headers
+        # and a body with a Content-Length
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = request_line.split(' ', 2)
+        headers = dict(line.split(':', 1) for line in header_lines if ':' in line)
+        length = int(next((value for name, value in headers.items()
+                           if name.strip().lower() == 'content-length'), '0'))
+        if length > MAX_BODY_BYTES:
+            raise ValueError('Body too large')
+        return method, target, await reader.readexactly(length)
+
+    async def _respond(self, method: str, target: str, body: bytes) -> tuple[str, str, bytes]:
+        if method != 'POST':
+            return '405 Method Not Allowed', 'text/plain', b''
+
+        # Subscription validation, echo the token back as plain text
+        validation_token = parse_qs(urlsplit(target).query).get('validationToken')
+        if validation_token:
+            return '200 OK', 'text/plain', validation_token[0].encode('utf-8')
+
+        try:
+            notifications = json.loads(body).get('value', [])
+        except (ValueError, AttributeError):
+            return '400 Bad Request', 'text/plain', b''
+
+        # All or nothing, so Graph's retry doesn't deliver some of them twice
+        if self._queue.maxsize - self._queue.qsize() < len(notifications):
+            self.rejected += len(notifications)
+            return '503 Service Unavailable', 'text/plain', b''
+
+        lifecycle_handler = self._lifecycle_handler
+        for notification in notifications:
+            self.received += 1
+            if not self._valid(notification):
+                self.invalid += 1
+            elif 'lifecycleEvent' in notification and lifecycle_handler is not None:
+                # Handled right away, they're rare and renewals are time critical
+                task = asyncio.ensure_future(lifecycle_handler(notification))
+                self._lifecycle_tasks.add(task)
+                task.add_done_callback(self._lifecycle_done)
+            else:
+                self._queue.put_nowait(notification)
+        return '202 Accepted', 'text/plain', b''
+
+    def _lifecycle_done(self, task: asyncio.Task) -> None:
+        # Nothing awaits these tasks, so a failure would only show up as
+        # "Task exception was never retrieved" when the task is collected
+        self._lifecycle_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Lifecycle notification handler failed', exc_info=task.exception())
+
+    def _valid(self, notification: dict[str, Any]) -> bool:
+        if self._client_state is None:
+            return True
+        # Constant time, the client state is the secret that proves the
+        # notification came from Graph
+        return hmac.compare_digest(str(notification.get('clientState', '')), self._client_state)
+
+    async def _consume(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self._options.batch_delay
+            while len(batch) < self._options.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._handler(batch)
+                self.processed += len(batch)
+            except Exception: # pylint: disable=broad-exception-caught
+                self.failed_batches += 1
+            finally:
+                self.batches += 1
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def sample_notification(
+        resource: str,
+        change_type: str = 'created',
+        client_state: str | None = None) -> dict[str, Any]:
+        # Shaped like the notifications Graph sends, for offline testing
+        return {
+            'subscriptionId': str(uuid.uuid4()),
+            'subscriptionExpirationDateTime':
+                (datetime.now(timezone.utc) + MAX_OUTLOOK_LIFETIME).isoformat(),
+            'changeType': change_type,
+            'resource': resource,
+            'resourceData': {
+                '@odata.type': '#Microsoft.Graph.Message',
+                'id': resource.rsplit('/', 1)[-1].strip('\')'),
+            },
+            'clientState': client_state,
+            'tenantId': str(uuid.uuid4()),
+        }
+
+    async def post(self, notifications: list[dict[str, Any]]) -> int:
+        # Delivers notifications the way Graph does and returns the status code
+        async with httpx.AsyncClient(timeout=RESPONSE_DEADLINE) as client:
+            response = await client.post(self.url, json={'value': notifications})
+            return response.status_code
+
+class ChangeNotifications:
+    @staticmethod
+    async def subscribe_to_mail_and_events(
+        graph_client: GraphServiceClient,
+        notification_url: str) -> SubscriptionManager:
+        # Replaces polling /me/messages and /me/calendarView
+        manager = SubscriptionManager(graph_client, notification_url)
+        await manager.subscribe('me/mailFolders(\'Inbox\')/messages', 'created')
+        await manager.subscribe('me/events', 'created,updated,deleted')
+
+        # Keep the subscriptions alive, call manager.stop(delete=True) when done
+        manager.start()
+        return manager
+
+    @staticmethod
+    async def receive_offline(count: int = 200) -> WebhookReceiver:
+        # Runs the receiver on a local port and posts sample notifications
+        # to it, no tenant or public endpoint needed
+        client_state = secrets.token_urlsafe(32)
+
+        async def handle(batch: list[dict[str, Any]]) -> None:
+            print(f'Processing {len(batch)} notifications')
+
+        options = ReceiverOptions(queue_size=100, batch_size=25)
+        receiver = WebhookReceiver(handle, client_state, options)
+        await receiver.start()
+        try:
+            for index in range(0, count, 10):
+                notifications = [WebhookReceiver.sample_notification(
+                    f'Users/me/Messages(\'{index + offset}\')', client_state=client_state)
+                                 for offset in range(10)]
+                while await receiver.post(notifications) == 503:
+                    # Back-pressure, wait like Graph would before trying again
+                    await asyncio.sleep(0.1)
+        finally:
+            await receiver.stop()
+        return receiver
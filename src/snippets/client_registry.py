@@ -0,0 +1,134 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import inspect
+import threading
+from typing import Any, Callable, NamedTuple
+import httpx
+from kiota_authentication_azure.azure_identity_authentication_provider import (
+    AzureIdentityAuthenticationProvider)
+from kiota_http.kiota_client_factory import DEFAULT_CONNECTION_TIMEOUT, DEFAULT_REQUEST_TIMEOUT
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph.graph_request_adapter import GraphRequestAdapter, options as graph_options
+from msgraph_core import APIVersion, GraphClientFactory
+from snippets.async_credential import AsyncCredentialAdapter
+from snippets.middleware.single_flight_middleware import SingleFlightMiddleware
+
+class ClientKey(NamedTuple):
+    tenant_id: str
+    client_id: str
+    scopes: tuple[str, ...]
+    host: str
+
+# pylint: disable=too-few-public-methods
+class ConnectionPoolOptions:
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True) -> None:
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    def create_http_client(self, host: str) -> httpx.AsyncClient:
+        # HTTP/2 multiplexes concurrent requests over one connection per host,
+        # so max_connections mostly matters for HTTP/1.1 fallbacks
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry),
+            timeout=httpx.Timeout(DEFAULT_REQUEST_TIMEOUT, connect=DEFAULT_CONNECTION_TIMEOUT),
+            http2=self.http2,
+            base_url=f'{host}/{APIVersion.v1}')
+
+class _PooledClient(NamedTuple):
+    graph_client: GraphServiceClient
+    http_client: httpx.AsyncClient
+    credential: Any
+    single_flight: SingleFlightMiddleware
+
+class GraphClientRegistry:
+    def __init__(self, pool_options: ConnectionPoolOptions | None = None) -> None:
+        self.pool_options = pool_options or ConnectionPoolOptions()
+        self._clients: dict[ClientKey, _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    def get_client(
+        self,
+        key: ClientKey,
+        credential_factory: Callable[[], Any]) -> GraphServiceClient:
+        # credential_factory is only called the first time a key is seen, so
+        # the credential and its token cache are shared like the connections
+        pooled = self._clients.get(key)
+        if pooled is not None:
+            return pooled.graph_client
+
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is None:
+                pooled = self._create_client(key, credential_factory())
+                self._clients[key] = pooled
+            return pooled.graph_client
+
+    def get_credential(self, key: ClientKey) -> Any:
+        # The credential behind a pooled client, for example to refresh its tokens
+        pooled = self._clients.get(key)
+        return pooled.credential if pooled is not None else None
+
+    def get_http_client(self, key: ClientKey) -> httpx.AsyncClient | None:
+        # The pooled HTTP client, with the Graph middleware applied
+        pooled = self._clients.get(key)
+        return pooled.http_client if pooled is not None else None
+
+    def get_single_flight(self, key: ClientKey) -> SingleFlightMiddleware | None:
+        # The middleware that coalesces identical concurrent GETs of a pooled
+        # client, its deduplicated count is the number of calls saved
+        pooled = self._clients.get(key)
+        return pooled.single_flight if pooled is not None else None
+
+    def _create_client(self, key: ClientKey, credential: Any) -> _PooledClient:
+        # NationalClouds members compare equal to their URL, but only
+        # format as one on some Python versions
+        host = str(getattr(key.host, 'value', key.host))
+        # Sync credentials get their tokens on a worker thread, one refresh
+        # at a time per scope set, so they don't stall the other requests
+        credential = AsyncCredentialAdapter.wrap(credential)
+        auth_provider = AzureIdentityAuthenticationProvider(credential, scopes=list(key.scopes))
+
+        # Apply the default Graph middleware to the pooled HTTP client, after
+        # coalescing identical requests that are in flight at the same time
+        single_flight = SingleFlightMiddleware()
+        http_client = GraphClientFactory.create_with_custom_middleware(
+            [single_flight, *GraphClientFactory.get_default_middleware(graph_options)],
+            client=self.pool_options.create_http_client(host))
+
+        adapter = GraphRequestAdapter(auth_provider, http_client)
+        adapter.base_url = f'{host}/{APIVersion.v1}'
+
+        return _PooledClient(GraphServiceClient(request_adapter=adapter), http_client, credential,
+                             single_flight)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+        for pooled in clients:
+            await pooled.http_client.aclose()
+            # The adapter's close is a no-op, aclose releases its threads
+            close = getattr(pooled.credential, 'aclose', None) or \
+                getattr(pooled.credential, 'close', None)
+            if close is not None:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+
+# Shared by every caller in the process, close it with aclose() on shutdown
+DEFAULT_REGISTRY = GraphClientRegistry()
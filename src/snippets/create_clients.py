@@ -2,8 +2,10 @@
 # Licensed under the MIT License.
 
 from azure.identity import (
+    AuthenticationRecord,
     DeviceCodeCredential,
     InteractiveBrowserCredential,
+    TokenCachePersistenceOptions,
     UsernamePasswordCredential)
 from azure.identity.aio import (
     AuthorizationCodeCredential,
@@ -145,6 +147,48 @@ class CreateClients:
 
         return graph_client
 
+    @staticmethod
+    def create_with_persistent_token_cache() -> GraphServiceClient:
+        # <PersistentTokenCacheSnippet>
+        scopes = ['User.Read']
+
+        # Multi-tenant apps can use "common",
+        # single-tenant apps must use the tenant ID from the Azure portal
+        tenant_id = 'common'
+
+        # Values from app registration
+        client_id = 'YOUR_CLIENT_ID'
+
+        # Saved after the first sign in, it identifies the account
+        # but contains no tokens
+        record_path = 'auth_record.json'
+
+        # azure.identity
+        # Tokens are kept in an encrypted cache that outlives the process
+        cache_options = TokenCachePersistenceOptions(name='msgraph-snippets')
+
+        try:
+            with open(record_path, 'r', encoding='utf-8') as record_file:
+                record = AuthenticationRecord.deserialize(record_file.read())
+        except FileNotFoundError:
+            record = None
+
+        credential = DeviceCodeCredential(
+            tenant_id=tenant_id,
+            client_id=client_id,
+            cache_persistence_options=cache_options,
+            authentication_record=record)
+
+        if record is None:
+            record = credential.authenticate(scopes=scopes)
+            with open(record_path, 'w', encoding='utf-8') as record_file:
+                record_file.write(record.serialize())
+
+        graph_client = GraphServiceClient(credential, scopes)
+        # </PersistentTokenCacheSnippet>
+
+        return graph_client
+
     @staticmethod
     def create_with_interactive() -> GraphServiceClient:
         # <InteractiveSnippet>
@@ -18,21 +18,56 @@ from msgraph.generated.models.giphy_rating_type import GiphyRatingType
 from msgraph.generated.models.message_collection_response import MessageCollectionResponse
 from msgraph.generated.models.event_collection_response import EventCollectionResponse
 from msgraph.graph_service_client import GraphServiceClient
+from snippets.request_scheduler import RequestScheduler, ScheduleReport
 
 class CreateRequests:
     @staticmethod
-    async def run_all_samples(graph_client: GraphServiceClient) -> None:
+    async def run_all_samples(
+        graph_client: GraphServiceClient, max_concurrency: int = 4) -> ScheduleReport:
+        scheduler = RequestScheduler(max_concurrency)
+
         # Create a new message
+        scheduler.add('create_message',
+                      lambda: CreateRequests.create_temporary_message(graph_client))
+
+        # Get a team to update
+        scheduler.add('get_team', lambda: CreateRequests.get_team_id(graph_client))
+
+        # Independent requests
+        scheduler.add('read', lambda: CreateRequests.make_read_request(graph_client))
+        scheduler.add('select', lambda: CreateRequests.make_select_request(graph_client))
+        scheduler.add('list', lambda: CreateRequests.make_list_request(graph_client))
+        scheduler.add('create', lambda: CreateRequests.make_create_request(graph_client))
+        scheduler.add('headers', lambda: CreateRequests.make_headers_request(graph_client))
+        scheduler.add('query_parameters',
+                      lambda: CreateRequests.make_query_parameters_request(graph_client))
+
+        # The temporary message must be read before it is deleted
+        scheduler.add('item_by_id', lambda: CreateRequests.make_item_by_id_request(
+            graph_client, scheduler.result('create_message')), ['create_message'])
+        scheduler.add('expand', lambda: CreateRequests.make_expand_request(
+            graph_client, scheduler.result('create_message')), ['create_message'])
+        scheduler.add('delete', lambda: CreateRequests.make_delete_request(
+            graph_client, scheduler.result('create_message')), ['item_by_id', 'expand'])
+
+        scheduler.add('update', lambda: CreateRequests.make_update_request(
+            graph_client, scheduler.result('get_team')), ['get_team'])
+
+        return await scheduler.run()
+
+    @staticmethod
+    async def create_temporary_message(graph_client: GraphServiceClient) -> str:
         message = Message()
         message.subject = 'Temporary'
 
         temp_message = await graph_client.me.messages.post(message)
         if temp_message and temp_message.id:
-            message_id = temp_message.id
-        else:
-            raise RuntimeError('Could not create a temporary message')
+            return temp_message.id
 
-        # Get a team to update
+        raise RuntimeError('Could not create a temporary message')
+
+    @staticmethod
+    async def get_team_id(graph_client: GraphServiceClient) -> str:
         query_params = GroupsRequestBuilder.GroupsRequestBuilderGetQueryParameters(
             filter='resourceProvisioningOptions/Any(x:x eq \'Team\')'
         )
@@ -43,20 +78,9 @@ class CreateRequests:
 
         teams = await graph_client.groups.get(config)
         if teams and teams.value and teams.value[0].id:
-            team_id = teams.value[0].id
-        else:
-            raise RuntimeError('Could not get a team')
-
-        await CreateRequests.make_read_request(graph_client)
-        await CreateRequests.make_select_request(graph_client)
-        await CreateRequests.make_list_request(graph_client)
-        await CreateRequests.make_item_by_id_request(graph_client, message_id)
-        await CreateRequests.make_expand_request(graph_client, message_id)
-        await CreateRequests.make_delete_request(graph_client, message_id)
-        await CreateRequests.make_create_request(graph_client)
-        await CreateRequests.make_update_request(graph_client, team_id)
-        await CreateRequests.make_headers_request(graph_client)
-        await CreateRequests.make_query_parameters_request(graph_client)
+            return teams.value[0].id
+
+        raise RuntimeError('Could not get a team')
 
     @staticmethod
     async def make_read_request(graph_client: GraphServiceClient) -> User | None:
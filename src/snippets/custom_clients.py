@@ -1,7 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from typing import List
+from typing import List, Optional
 from azure.core.credentials import TokenCredential
 from azure.identity import DeviceCodeCredential
 from msgraph.graph_service_client import GraphServiceClient
@@ -10,12 +10,16 @@ from msgraph_core import GraphClientFactory
 from kiota_authentication_azure.azure_identity_authentication_provider import (
     AzureIdentityAuthenticationProvider)
 from httpx import AsyncClient
-from middleware.custom_middleware import CustomMiddleware
+from kiota_http.middleware.middleware import BaseMiddleware
+from snippets.middleware.custom_middleware import CustomMiddleware
+from snippets.middleware.metrics_middleware import MetricsMiddleware
 
 class CustomClients:
     @staticmethod
     def create_with_custom_middleware(
-        credential: TokenCredential, scopes: List[str]) -> GraphServiceClient:
+        credential: TokenCredential,
+        scopes: List[str],
+        additional_middleware: Optional[List[BaseMiddleware]] = None) -> GraphServiceClient:
         # <CustomMiddlewareSnippet>
         # Create an authentication provider
         # credential is one of the credential classes from azure.identity
@@ -29,7 +33,16 @@ class CustomClients:
         # Add custom middleware
         # Implement a custom middleware by extending the BaseMiddleware class
         # https://github.com/microsoft/kiota-http-go/blob/main/kiota_http/middleware/middleware.py
+        # CustomMiddleware logs each request at DEBUG level. MetricsMiddleware
+        # records latency, status codes and bytes per route, export them
+        # with DEFAULT_METRICS.prometheus_text()
         middleware.append(CustomMiddleware())
+        middleware.append(MetricsMiddleware())
+
+        # Optional middleware, for example CacheMiddleware, HedgingMiddleware
+        # or CompressionMiddleware, runs after the custom middleware
+        if additional_middleware:
+            middleware.extend(additional_middleware)
 
         # Create an HTTP client with the middleware
         http_client = GraphClientFactory.create_with_custom_middleware(middleware)
@@ -45,7 +58,8 @@ class CustomClients:
 
     @staticmethod
     def create_with_proxy(
-        scopes: List[str]) -> GraphServiceClient:
+        scopes: List[str],
+        additional_middleware: Optional[List[BaseMiddleware]] = None) -> GraphServiceClient:
         # <ProxySnippet>
         # Proxy URLs
         proxies = {
@@ -75,8 +89,13 @@ class CustomClients:
         # proxies is an optional dict containing proxies configuration in httpx format
         http_client = AsyncClient(proxies=httpx_proxies) # type: ignore
 
-        # Apply the default Graph middleware to the HTTP client
-        http_client = GraphClientFactory.create_with_default_middleware(client=http_client)
+        # Apply the default Graph middleware to the HTTP client, followed by
+        # any additional middleware. CompressionMiddleware cuts the number
+        # of bytes that go through a bandwidth-limited proxy
+        http_client = GraphClientFactory.create_with_custom_middleware(
+            [*GraphClientFactory.get_default_middleware(options=None),
+             *(additional_middleware or [])],
+            client=http_client)
 
         # Create a request adapter with the HTTP client
         adapter = GraphRequestAdapter(auth_provider, http_client)
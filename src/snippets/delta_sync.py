@@ -0,0 +1,207 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import sqlite3
+import time
+from typing import Any, AsyncIterator
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from msgraph.generated.users.item.calendar_view.delta.delta_request_builder import (
+    DeltaRequestBuilder as CalendarViewDeltaRequestBuilder)
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.graph_service_client import GraphServiceClient
+
+# Error codes Graph returns when a delta or skip token can no longer be used
+STALE_TOKEN_ERROR_CODES = {'syncstatenotfound', 'syncstateinvalid', 'resyncrequired'}
+
+# pylint: disable=too-few-public-methods
+class DeltaChange:
+    change_type: str
+    item_id: str
+    item: Any
+
+    def __init__(self, change_type: str, item_id: str, item: Any = None) -> None:
+        # change_type is one of 'added', 'changed' or 'removed'
+        self.change_type = change_type
+        self.item_id = item_id
+        self.item = item
+
+class DeltaTokenStore:
+    def __init__(self, path: str = 'delta_tokens.db') -> None:
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS delta_tokens (
+                user_id TEXT NOT NULL,
+                resource TEXT NOT NULL,
+                link TEXT,
+                is_delta_link INTEGER NOT NULL DEFAULT 0,
+                generation INTEGER NOT NULL DEFAULT 0,
+                resyncing INTEGER NOT NULL DEFAULT 1,
+                updated REAL NOT NULL,
+                PRIMARY KEY (user_id, resource));
+            CREATE TABLE IF NOT EXISTS delta_items (
+                user_id TEXT NOT NULL,
+                resource TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (user_id, resource, item_id));
+        ''')
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get_state(self, user_id: str, resource: str) -> tuple[str | None, bool, int, bool]:
+        # Returns (link, is_delta_link, generation, resyncing)
+        row = self._connection.execute(
+            'SELECT link, is_delta_link, generation, resyncing FROM delta_tokens '
+            'WHERE user_id = ? AND resource = ?', (user_id, resource)).fetchone()
+        if row is None:
+            return None, False, 0, True
+        return row[0], bool(row[1]), row[2], bool(row[3])
+
+    def start_resync(self, user_id: str, resource: str) -> int:
+        # Forget the token and start a new generation, so items that are not
+        # seen again during the full sync can be reported as removed
+        _, _, generation, _ = self.get_state(user_id, resource)
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO delta_tokens '
+                '(user_id, resource, link, is_delta_link, generation, resyncing, updated) '
+                'VALUES (?, ?, NULL, 0, ?, 1, ?)',
+                (user_id, resource, generation + 1, time.time()))
+        return generation + 1
+
+    def is_known(self, user_id: str, resource: str, item_id: str) -> bool:
+        return self._connection.execute(
+            'SELECT 1 FROM delta_items WHERE user_id = ? AND resource = ? AND item_id = ?',
+            (user_id, resource, item_id)).fetchone() is not None
+
+    def save_page(
+        self,
+        user_id: str,
+        resource: str,
+        link: str,
+        is_delta_link: bool,
+        changes: list[DeltaChange]) -> None:
+        # Items and the link to resume from are committed together, so a
+        # crash replays at most the page that was being processed
+        _, _, generation, resyncing = self.get_state(user_id, resource)
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO delta_items (user_id, resource, item_id, generation) '
+                'VALUES (?, ?, ?, ?)', [(user_id, resource, change.item_id, generation)
+                                        for change in changes
+                                        if change.change_type != 'removed'])
+            self._connection.executemany(
+                'DELETE FROM delta_items WHERE user_id = ? AND resource = ? AND item_id = ?',
+                [(user_id, resource, change.item_id) for change in changes
+                 if change.change_type == 'removed'])
+            self._connection.execute(
+                'UPDATE delta_tokens SET link = ?, is_delta_link = ?, resyncing = ?, updated = ? '
+                'WHERE user_id = ? AND resource = ?',
+                (link, int(is_delta_link), int(resyncing and not is_delta_link), time.time(),
+                 user_id, resource))
+
+    def stale_items(self, user_id: str, resource: str, generation: int) -> list[str]:
+        rows = self._connection.execute(
+            'SELECT item_id FROM delta_items '
+            'WHERE user_id = ? AND resource = ? AND generation < ?',
+            (user_id, resource, generation)).fetchall()
+        return [row[0] for row in rows]
+
+class DeltaSync:
+    def __init__(
+        self,
+        graph_client: GraphServiceClient,
+        store: DeltaTokenStore,
+        user_id: str = 'me') -> None:
+        self._graph_client = graph_client
+        self._store = store
+        self._user_id = user_id
+
+    def _user(self) -> Any:
+        if self._user_id == 'me':
+            return self._graph_client.me
+        return self._graph_client.users.by_user_id(self._user_id)
+
+    def sync_messages(self, folder_id: str = 'inbox') -> AsyncIterator[DeltaChange]:
+        # GET /me/mailFolders/{folder-id}/messages/delta
+        builder = self._user().mail_folders.by_mail_folder_id(folder_id).messages.delta
+        return self._sync(f'messages/{folder_id}', builder, None)
+
+    def sync_events(self, start_date_time: str, end_date_time: str) -> AsyncIterator[DeltaChange]:
+        # GET /me/calendarView/delta?startDateTime={start}&endDateTime={end}
+        query_params = CalendarViewDeltaRequestBuilder.DeltaRequestBuilderGetQueryParameters(
+            start_date_time=start_date_time,
+            end_date_time=end_date_time
+        )
+
+        config = RequestConfiguration(
+            query_parameters=query_params
+        )
+
+        builder = self._user().calendar_view.delta
+        return self._sync(f'events/{start_date_time}/{end_date_time}', builder, config)
+
+    async def _sync(
+        self,
+        resource: str,
+        builder: Any,
+        config: RequestConfiguration | None) -> AsyncIterator[DeltaChange]:
+        link, _, generation, resyncing = self._store.get_state(self._user_id, resource)
+        if link is None:
+            generation = self._store.start_resync(self._user_id, resource)
+            resyncing = True
+
+        while True:
+            try:
+                page = await (builder.with_url(link).get() if link else builder.get(config))
+            except ODataError as error:
+                if not link or not DeltaSync._is_stale_token_error(error):
+                    raise
+                # The server no longer recognizes the saved token, or a next
+                # link expired while paging, start over
+                generation = self._store.start_resync(self._user_id, resource)
+                resyncing = True
+                link = None
+                continue
+            if page is None:
+                break
+
+            changes = self._changes_from_page(resource, page.value or [])
+            if page.odata_next_link is None and resyncing:
+                # Items from before a full resync that weren't returned again are gone
+                seen = {change.item_id for change in changes}
+                changes.extend(DeltaChange('removed', item_id) for item_id
+                               in self._store.stale_items(self._user_id, resource, generation)
+                               if item_id not in seen)
+
+            for change in changes:
+                yield change
+
+            link = page.odata_next_link or page.odata_delta_link
+            if not link:
+                break
+            self._store.save_page(
+                self._user_id, resource, link, page.odata_next_link is None, changes)
+            if page.odata_next_link is None:
+                break
+
+    def _changes_from_page(self, resource: str, items: list[Any]) -> list[DeltaChange]:
+        changes: list[DeltaChange] = []
+        for item in items:
+            if not item.id:
+                continue
+            if item.additional_data and '@removed' in item.additional_data:
+                changes.append(DeltaChange('removed', item.id))
+            elif self._store.is_known(self._user_id, resource, item.id):
+                changes.append(DeltaChange('changed', item.id, item))
+            else:
+                changes.append(DeltaChange('added', item.id, item))
+        return changes
+
+    @staticmethod
+    def _is_stale_token_error(error: ODataError) -> bool:
+        if error.response_status_code == 410:
+            return True
+        code = error.error.code if error.error and error.error.code else ''
+        return code.lower() in STALE_TOKEN_ERROR_CODES
@@ -0,0 +1,263 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import mmap
+import os
+import time
+from typing import AsyncIterator, Callable
+import httpx
+from msgraph.generated.models.attachment_item import AttachmentItem
+from msgraph.generated.models.attachment_type import AttachmentType
+from msgraph.generated.models.message import Message
+from msgraph.generated.users.item.messages.item.attachments.create_upload_session import (
+    create_upload_session_post_request_body)
+from msgraph.graph_service_client import GraphServiceClient
+
+# Upload sessions expect chunks in multiples of 320 KiB, Outlook accepts
+# at most 4 MiB per request
+CHUNK_MULTIPLE = 320 * 1024
+DEFAULT_CHUNK_SIZE = 10 * CHUNK_MULTIPLE
+
+# Size of the slices handed to the socket while a chunk is being sent
+WRITE_SIZE = 64 * 1024
+
+# Called with (bytes uploaded, total bytes, bytes per second)
+ProgressCallback = Callable[[int, int, float], None]
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(f'Upload failed with {status_code}: {message}')
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in (408, 429) or self.status_code >= 500
+
+# pylint: disable=too-few-public-methods
+class UploadOptions:
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_workers: int = 1,
+        max_retries: int = 5,
+        retry_delay: float = 1.0) -> None:
+        # Outlook and OneDrive upload sessions expect ranges in order, so
+        # only raise max_workers for services that accept ranges out of order
+        if chunk_size % CHUNK_MULTIPLE:
+            raise ValueError(f'chunk_size must be a multiple of {CHUNK_MULTIPLE}')
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+class ChunkedUpload:
+    bytes_uploaded: int
+
+    def __init__(
+        self,
+        upload_url: str,
+        file_path: str,
+        options: UploadOptions | None = None,
+        on_progress: ProgressCallback | None = None) -> None:
+        self._upload_url = upload_url
+        self._file_path = file_path
+        self._options = options or UploadOptions()
+        self._on_progress = on_progress
+        self._started = 0.0
+        self.bytes_uploaded = 0
+
+    async def upload(self, http_client: httpx.AsyncClient | None = None) -> httpx.Response:
+        # Returns the response to the last chunk. The upload URL is
+        # pre-authenticated, so it's called without the Graph middleware
+        # and must not get an Authorization header
+        if os.path.getsize(self._file_path) == 0:
+            # An empty file can't be mapped, and has no range to send
+            raise ValueError(f'{self._file_path} is empty')
+
+        client = http_client or httpx.AsyncClient(timeout=httpx.Timeout(60.0))
+        try:
+            with open(self._file_path, 'rb') as source, \
+                 mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    return await self._upload_with_retries(client, mapped, view)
+                finally:
+                    view.release()
+        finally:
+            if http_client is None:
+                await client.aclose()
+
+    async def _upload_with_retries(
+        self, client: httpx.AsyncClient, mapped: mmap.mmap, view: memoryview) -> httpx.Response:
+        total = len(view)
+        pending = [(0, total)]
+        self._started = time.monotonic()
+        retries = 0
+        while True:
+            try:
+                return await self._upload_ranges(client, mapped, view, pending)
+            except (httpx.TransportError, UploadError) as error:
+                if isinstance(error, UploadError) and not error.retryable:
+                    raise
+                retries += 1
+                if retries > self._options.max_retries:
+                    raise
+                await asyncio.sleep(self._options.retry_delay * 2 ** (retries - 1))
+
+                # Ask the server which ranges it still needs and carry on from there
+                pending = await self._next_expected_ranges(client, total)
+                self.bytes_uploaded = total - sum(end - start for start, end in pending)
+
+    async def _upload_ranges(
+        self,
+        client: httpx.AsyncClient,
+        mapped: mmap.mmap,
+        view: memoryview,
+        pending: list[tuple[int, int]]) -> httpx.Response:
+        chunk_size = self._options.chunk_size
+        chunks = [(offset, min(offset + chunk_size, end))
+                  for start, end in pending for offset in range(start, end, chunk_size)]
+        chunks.reverse()
+        final: list[httpx.Response] = []
+
+        async def worker() -> None:
+            while chunks:
+                start, end = chunks.pop()
+                response = await self._put_chunk(client, view, start, end, len(view))
+                if response.status_code in (200, 201):
+                    final.append(response)
+                ChunkedUpload._release_pages(mapped, start, end)
+
+        workers = [asyncio.create_task(worker())
+                   for _ in range(max(1, min(self._options.max_workers, len(chunks))))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+        if not final:
+            raise UploadError(202, 'the server did not acknowledge the last chunk')
+        return final[-1]
+
+    async def _put_chunk(
+        self,
+        client: httpx.AsyncClient,
+        view: memoryview,
+        start: int,
+        end: int,
+        total: int) -> httpx.Response:
+        response = await client.put(
+            self._upload_url,
+            # httpx hands each slice straight to the socket, any bytes-like object works
+            content=ChunkedUpload._slices(view, start, end), # type: ignore
+            headers={
+                'Content-Length': str(end - start),
+                'Content-Range': f'bytes {start}-{end - 1}/{total}',
+            })
+        if response.status_code not in (200, 201, 202):
+            raise UploadError(response.status_code, response.text)
+
+        self.bytes_uploaded += end - start
+        if self._on_progress is not None:
+            elapsed = time.monotonic() - self._started
+            self._on_progress(self.bytes_uploaded, total,
+                              self.bytes_uploaded / elapsed if elapsed else 0.0)
+        return response
+
+    async def _next_expected_ranges(
+        self, client: httpx.AsyncClient, total: int) -> list[tuple[int, int]]:
+        response = await client.get(self._upload_url)
+        if response.status_code != 200:
+            raise UploadError(response.status_code, response.text)
+
+        # Ranges look like "12345-" or "12345-55232", the end is inclusive
+        ranges = []
+        for expected in response.json().get('nextExpectedRanges', []):
+            start, _, end = expected.partition('-')
+            ranges.append((int(start), int(end) + 1 if end else total))
+        return ranges
+
+    @staticmethod
+    async def _slices(view: memoryview, start: int, end: int) -> AsyncIterator[memoryview]:
+        # Slicing a memoryview doesn't copy, the bytes are only read from
+        # the mapped file as the socket writes them
+        for offset in range(start, end, WRITE_SIZE):
+            yield view[offset:min(offset + WRITE_SIZE, end)]
+
+    @staticmethod
+    def _release_pages(mapped: mmap.mmap, start: int, end: int) -> None:
+        # Let the OS drop pages that have been sent, so resident memory
+        # stays at a few chunks however large the file is. madvise needs a
+        # page aligned start, and a resumed upload can start anywhere, so
+        # only the pages that lie wholly inside the range are dropped
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        first = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if last <= first:
+            return
+        try:
+            mapped.madvise(mmap.MADV_DONTNEED, first, last - first)
+        except OSError:
+            # Only advice, the upload carries on without it
+            pass
+
+class LargeFileUpload:
+    @staticmethod
+    async def upload_to_draft(graph_client: GraphServiceClient, file_path: str) -> bool:
+        # Attach the file to a new draft, then delete the draft. The
+        # attachment goes with it, so only whether the upload finished
+        # is returned
+        # Raises OSError for a missing file and ValueError for an empty
+        # one, before anything is created
+        if os.path.getsize(file_path) == 0:
+            raise ValueError(f'{file_path} is empty')
+
+        message = Message()
+        message.subject = 'Large attachment'
+
+        draft = await graph_client.me.messages.post(message)
+        if not draft or not draft.id:
+            raise RuntimeError('Could not create a draft message')
+
+        try:
+            location = await LargeFileUpload.upload_attachment(graph_client, draft.id, file_path)
+            return location is not None
+        finally:
+            await graph_client.me.messages.by_message_id(draft.id).delete()
+
+    @staticmethod
+    async def upload_attachment(
+        graph_client: GraphServiceClient,
+        message_id: str,
+        file_path: str,
+        options: UploadOptions | None = None) -> str | None:
+        # POST https://graph.microsoft.com/v1.0/me/messages/{message-id}/attachments/
+        # createUploadSession
+        # message_id is a string containing the id property of the message
+        attachment = AttachmentItem()
+        attachment.attachment_type = AttachmentType.File
+        attachment.name = os.path.basename(file_path)
+        attachment.size = os.path.getsize(file_path)
+
+        request_body = create_upload_session_post_request_body.CreateUploadSessionPostRequestBody()
+        request_body.attachment_item = attachment
+
+        upload_session = await graph_client.me.messages.by_message_id(
+            message_id).attachments.create_upload_session.post(request_body)
+        if not upload_session or not upload_session.upload_url:
+            return None
+
+        def report(uploaded: int, total: int, bytes_per_second: float) -> None:
+            print(f'Uploaded {uploaded} of {total} bytes, '
+                  f'{bytes_per_second / 1024 / 1024:.1f} MB/s')
+
+        upload = ChunkedUpload(upload_session.upload_url, file_path, options, report)
+        response = await upload.upload()
+
+        # The URL of the new attachment
+        return response.headers.get('location')
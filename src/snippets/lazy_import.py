@@ -0,0 +1,29 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import importlib.util
+import sys
+from types import ModuleType
+
+# pylint: disable=too-few-public-methods
+class LazyImport:
+    @staticmethod
+    def module(name: str) -> ModuleType:
+        # Returns the module without running it. Its code, and everything
+        # it imports, runs the first time one of its attributes is used.
+        # The msgraph request builders and models are large, so modules
+        # that use them are only paid for by the code paths that need them
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.loader is None:
+            raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
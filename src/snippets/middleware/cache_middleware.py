@@ -0,0 +1,173 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import Request, Response, AsyncBaseTransport
+
+# Request headers that change the representation Graph returns
+VARY_HEADERS = ('authorization', 'prefer', 'accept', 'consistencylevel')
+
+# Response headers that no longer apply once the body has been decoded
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+# Rough per-entry overhead for headers and bookkeeping, counted against the budget
+ENTRY_OVERHEAD = 512
+
+DEFAULT_TTL_RULES = [
+    (r'^/(v1\.0|beta)/me$', 300.0),
+    (r'^/(v1\.0|beta)/me/events', 30.0),
+]
+
+def request_key(request: Request) -> str:
+    # Hash the vary headers so different users never share an entry
+    # and access tokens aren't kept in memory as plain text
+    digest = hashlib.sha256()
+    for name in VARY_HEADERS:
+        digest.update(request.headers.get(name, '').encode('utf-8'))
+        digest.update(b'\0')
+    return f'{request.url} {digest.hexdigest()}'
+
+class CacheEntry:
+    # pylint: disable=too-few-public-methods
+    def __init__(
+        self,
+        path: str,
+        status_code: int,
+        headers: list[tuple[str, str]],
+        content: bytes,
+        expires: float) -> None:
+        self.path = path
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.expires = expires
+        self.etag = next((value for name, value in headers if name.lower() == 'etag'), None)
+        self.size = len(content) + ENTRY_OVERHEAD
+
+    def to_response(self, request: Request) -> Response:
+        return Response(
+            self.status_code, headers=self.headers, content=self.content, request=request)
+
+# pylint: disable=too-many-instance-attributes
+class CacheMiddleware(BaseMiddleware):
+    hits: int
+    misses: int
+    revalidated: int
+    evictions: int
+    invalidations: int
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        default_ttl: float = 60.0,
+        ttl_rules: list[tuple[str, float]] | None = None) -> None:
+        # ttl_rules is a list of (path regex, TTL in seconds), first match wins.
+        # A TTL of 0 disables caching for matching paths
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._ttl_rules = [(re.compile(pattern, re.IGNORECASE), ttl)
+                           for pattern, ttl in (ttl_rules or DEFAULT_TTL_RULES)]
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        if request.method in ('PATCH', 'POST', 'PUT', 'DELETE'):
+            response = await super().send(request, transport)
+            self.invalidate(request.url.path)
+            return response
+
+        ttl = self._ttl_for(request.url.path)
+
+        # Leave conditional requests made by the caller alone
+        if request.method != 'GET' or 'if-none-match' in request.headers or ttl <= 0:
+            return await super().send(request, transport)
+
+        return await self._send_cached(request, transport, ttl)
+
+    async def _send_cached(
+        self, request: Request, transport: AsyncBaseTransport, ttl: float) -> Response:
+        key = request_key(request)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            if now < entry.expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.to_response(request)
+            if entry.etag:
+                request.headers['If-None-Match'] = entry.etag
+
+        response = await super().send(request, transport)
+
+        if response.status_code == 304 and entry is not None:
+            await response.aclose()
+            if self._entries.get(key) is entry:
+                entry.expires = now + ttl
+                self._entries.move_to_end(key)
+                self.revalidated += 1
+                return entry.to_response(request)
+            # Invalidated by a write or evicted while the request was in
+            # flight. The server may have confirmed the version the write
+            # replaced, so it's fetched again as a miss
+            del request.headers['If-None-Match']
+            response = await super().send(request, transport)
+
+        self.misses += 1
+        if response.status_code != 200 or 'no-store' in response.headers.get('cache-control', ''):
+            self._remove(key)
+            return response
+
+        content = await response.aread()
+        headers = [(name, value) for name, value in response.headers.multi_items()
+                   if name.lower() not in DROPPED_HEADERS]
+        entry = CacheEntry(request.url.path.lower(), response.status_code, headers, content,
+                           now + ttl)
+        self._store(key, entry)
+        return entry.to_response(request)
+
+    def invalidate(self, path: str) -> None:
+        # Drop the resource itself, anything below it and its parent collection
+        path = path.lower().rstrip('/')
+        parent = path.rsplit('/', 1)[0]
+        stale = [key for key, entry in self._entries.items()
+                 if entry.path == path or entry.path == parent
+                 or entry.path.startswith(path + '/')]
+        for key in stale:
+            self._remove(key)
+        self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _ttl_for(self, path: str) -> float:
+        for pattern, ttl in self._ttl_rules:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        self._remove(key)
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
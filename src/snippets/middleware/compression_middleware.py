@@ -0,0 +1,150 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import gzip
+import zlib
+from typing import Any, AsyncIterator
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import AsyncByteStream, ByteStream, Request, Response, AsyncBaseTransport
+from snippets.middleware.metrics_middleware import GraphMetrics
+
+try:
+    import brotli # type: ignore
+except ImportError:
+    # Optional, without it only gzip is requested
+    brotli = None # type: ignore
+
+# Request bodies smaller than this aren't worth the CPU to compress
+DEFAULT_MIN_REQUEST_SIZE = 32 * 1024
+
+class CompressionStats:
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('requests', 'bytes_sent', 'bytes_sent_compressed',
+                 'bytes_received', 'bytes_received_compressed')
+
+    def __init__(self) -> None:
+        # Uncompressed sizes, and the sizes on the wire
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_sent_compressed = 0
+        self.bytes_received = 0
+        self.bytes_received_compressed = 0
+
+class _DecompressingStream(AsyncByteStream):
+    # Decompresses the body as the caller reads it, counting bytes both ways
+    def __init__(self, stream: Any, decoder: Any, stats: CompressionStats) -> None:
+        self._stream = stream
+        self._decoder = decoder
+        self._stats = stats
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._stats.bytes_received_compressed += len(chunk)
+            data = self._decoder.decompress(chunk) if self._decoder else chunk
+            if data:
+                self._stats.bytes_received += len(data)
+                yield data
+
+        tail = self._decoder.flush() if self._decoder else b''
+        if tail:
+            self._stats.bytes_received += len(tail)
+            yield tail
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+class _BrotliDecoder:
+    # pylint: disable=too-few-public-methods
+    def __init__(self) -> None:
+        self._decompressor = brotli.Decompressor() # type: ignore
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.process(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+class CompressionMiddleware(BaseMiddleware):
+    def __init__(self, compress_requests: bool = False,
+                 min_request_size: int = DEFAULT_MIN_REQUEST_SIZE) -> None:
+        # Add it last in the middleware list, so the other middleware see
+        # uncompressed bodies. compress_requests gzips bodies of at least
+        # min_request_size bytes, only use it with endpoints that accept
+        # gzip request bodies
+        super().__init__()
+        self.compress_requests = compress_requests
+        self.min_request_size = min_request_size
+        self.accept_encoding = 'br, gzip' if brotli is not None else 'gzip'
+        self._routes: dict[tuple[str, str], CompressionStats] = {}
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        stats = self.route_stats(request.method, request.url.path)
+        stats.requests += 1
+        request.headers['Accept-Encoding'] = self.accept_encoding
+        request = self._compress_request(request, stats)
+
+        response = await super().send(request, transport)
+
+        encoding = response.headers.get('content-encoding', '').strip().lower()
+        decoder: Any = None
+        if encoding == 'gzip':
+            decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        elif encoding == 'br' and brotli is not None:
+            decoder = _BrotliDecoder()
+        elif encoding not in ('', 'identity'):
+            # Left for httpx to decode, only the bytes on the wire are known
+            return response
+
+        if decoder is not None:
+            # The body is decoded here, httpx must not decode it again
+            del response.headers['content-encoding']
+            if 'content-length' in response.headers:
+                del response.headers['content-length']
+        response.stream = _DecompressingStream(response.stream, decoder, stats)
+        return response
+
+    def _compress_request(self, request: Request, stats: CompressionStats) -> Request:
+        # Only bodies already in memory, streamed uploads are sent as they are
+        if not isinstance(request.stream, ByteStream):
+            return request
+        content = request.content
+        stats.bytes_sent += len(content)
+
+        if not self.compress_requests or len(content) < self.min_request_size \
+                or 'content-encoding' in request.headers:
+            stats.bytes_sent_compressed += len(content)
+            return request
+
+        compressed = gzip.compress(content, compresslevel=6)
+        stats.bytes_sent_compressed += len(compressed)
+
+        headers = request.headers.copy()
+        headers['Content-Encoding'] = 'gzip'
+        headers['Content-Length'] = str(len(compressed))
+        compressed_request = Request(request.method, request.url, headers=headers,
+                                     content=compressed, extensions=request.extensions)
+        # Request options the kiota middleware attached to the request
+        if hasattr(request, 'options'):
+            setattr(compressed_request, 'options', getattr(request, 'options'))
+        return compressed_request
+
+    def route_stats(self, method: str, path: str) -> CompressionStats:
+        # Routes are grouped the same way as GraphMetrics
+        key = (method, GraphMetrics.route_template(path))
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = CompressionStats()
+        return stats
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [{
+            'method': method,
+            'route': route,
+            'requests': stats.requests,
+            'bytes_sent': stats.bytes_sent,
+            'bytes_sent_compressed': stats.bytes_sent_compressed,
+            'bytes_received': stats.bytes_received,
+            'bytes_received_compressed': stats.bytes_received_compressed,
+            'ratio': (stats.bytes_received_compressed / stats.bytes_received
+                      if stats.bytes_received else 1.0),
+        } for (method, route), stats in self._routes.items()]
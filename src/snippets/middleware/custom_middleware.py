@@ -2,13 +2,21 @@
 # Licensed under the MIT License.
 
 # <CustomMiddlewareSnippet>
+import logging
+import time
 from kiota_http.middleware.middleware import BaseMiddleware
 from httpx import Request, Response, AsyncBaseTransport
 
+logger = logging.getLogger(__name__)
+
 # pylint: disable=too-few-public-methods
 class CustomMiddleware(BaseMiddleware):
     async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
-        print(request.method, request.url)
+        # Logs each request at DEBUG level. The message is only formatted
+        # when DEBUG logging is enabled, so it costs almost nothing otherwise
+        started = time.perf_counter()
         response = await super().send(request, transport)
+        logger.debug('%s %s %d in %.1f ms', request.method, request.url.path,
+                     response.status_code, (time.perf_counter() - started) * 1000)
         return response
 # </CustomMiddlewareSnippet>
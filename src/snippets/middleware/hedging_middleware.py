@@ -0,0 +1,200 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import time
+from collections import deque
+from typing import Any
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import Request, Response, AsyncBaseTransport
+from snippets.middleware.metrics_middleware import GraphMetrics
+
+# Only idempotent reads are hedged, everything else is sent once
+DEFAULT_METHODS = ('GET', 'HEAD')
+
+# A throttled response doesn't end the race while the other request may still succeed
+THROTTLED_STATUS_CODES = (429, 503)
+
+# pylint: disable=too-few-public-methods
+class HedgingOptions:
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        sample_size: int = 200,
+        methods: tuple[str, ...] = DEFAULT_METHODS) -> None:
+        # A read that hasn't answered within the percentile of its route's
+        # last sample_size latencies is sent again. Routes with fewer than
+        # min_samples latencies aren't hedged. Hedges are capped at budget
+        # times the number of reads, 0.05 allows 5% extra requests
+        if not 0 < percentile < 100:
+            raise ValueError('percentile must be between 0 and 100')
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.sample_size = sample_size
+        self.methods = frozenset(method.upper() for method in methods)
+
+class HedgeStats:
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('latencies', 'delay', 'stale', 'requests', 'hedges_sent', 'hedges_won')
+
+    def __init__(self, sample_size: int) -> None:
+        self.latencies: deque[float] = deque(maxlen=sample_size)
+        # The percentile is recomputed after every tenth new latency
+        self.delay: float | None = None
+        self.stale = 0
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+class HedgingMiddleware(BaseMiddleware):
+    options: HedgingOptions
+
+    def __init__(self, options: HedgingOptions | None = None) -> None:
+        # Add it after the default middleware, so the retry handler retries
+        # the response that won and each hedge is a single attempt
+        super().__init__()
+        self.options = options or HedgingOptions()
+        self._routes: dict[tuple[str, str], HedgeStats] = {}
+        self._requests = 0
+        self._hedges = 0
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        if request.method not in self.options.methods:
+            return await super().send(request, transport)
+
+        stats = self.route_stats(request.method, request.url.path)
+        stats.requests += 1
+        self._requests += 1
+        delay = self._hedge_delay(stats)
+
+        if delay is None or self._hedges >= self.options.budget * self._requests:
+            # Sent inline, without a task, when there's no hedge to race it against
+            started = time.perf_counter()
+            response = await super().send(request, transport)
+            HedgingMiddleware._record(stats, time.perf_counter() - started)
+            return response
+        return await self._send_hedged(request, transport, stats, delay)
+
+    async def _send_hedged(
+        self,
+        request: Request,
+        transport: AsyncBaseTransport,
+        stats: HedgeStats,
+        delay: float) -> Response:
+        # The primary request is awaited directly, a hedge that wins cancels it
+        send = super().send
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(send(request, transport))
+        primary.add_done_callback(
+            lambda attempt: HedgingMiddleware._record_primary(stats, attempt, started))
+        hedges: list[asyncio.Future[Response]] = []
+        hedge_won = False
+
+        def hedge_done(hedge: asyncio.Future[Response]) -> None:
+            nonlocal hedge_won
+            if not primary.done() and HedgingMiddleware._usable(hedge):
+                hedge_won = True
+                primary.cancel()
+
+        def send_hedge() -> None:
+            if primary.done() or self._hedges >= self.options.budget * self._requests:
+                return
+            self._hedges += 1
+            stats.hedges_sent += 1
+            hedge = asyncio.ensure_future(send(request, transport))
+            hedge.add_done_callback(hedge_done)
+            hedges.append(hedge)
+
+        timer = asyncio.get_running_loop().call_later(delay, send_hedge)
+        winner: asyncio.Future[Response] | None = None
+        try:
+            try:
+                response = await primary
+                if HedgingMiddleware._usable(primary) or not hedges:
+                    winner = primary
+                    return response
+                # Throttled, the hedge in flight may still get through
+                await asyncio.wait(hedges)
+                if not HedgingMiddleware._usable(hedges[0]):
+                    winner = primary
+                    return response
+            except asyncio.CancelledError:
+                # Cancelled by a hedge that succeeded, or because the caller gave up
+                if not hedge_won:
+                    raise
+            except Exception: # pylint: disable=broad-exception-caught
+                # The primary failed, a hedge in flight may still answer
+                if not hedges:
+                    raise
+                await asyncio.wait(hedges)
+                if hedges[0].cancelled() or hedges[0].exception() is not None:
+                    raise
+            winner = hedges[0]
+            stats.hedges_won += 1
+            return winner.result()
+        finally:
+            timer.cancel()
+            await HedgingMiddleware._discard(
+                [attempt for attempt in [primary, *hedges] if attempt is not winner])
+
+    @staticmethod
+    def _usable(attempt: asyncio.Future[Response]) -> bool:
+        # A failed or throttled response doesn't end the race
+        return attempt.done() and not attempt.cancelled() and attempt.exception() is None \
+            and attempt.result().status_code not in THROTTLED_STATUS_CODES
+
+    @staticmethod
+    async def _discard(losers: list[asyncio.Future[Response]]) -> None:
+        # Cancels the requests still in flight and closes the responses
+        # that arrived too late, so their connections go back to the pool
+        for loser in losers:
+            loser.cancel()
+        for outcome in await asyncio.gather(*losers, return_exceptions=True):
+            if isinstance(outcome, Response):
+                await outcome.aclose()
+
+    def _hedge_delay(self, stats: HedgeStats) -> float | None:
+        if len(stats.latencies) < self.options.min_samples:
+            return None
+        if stats.delay is None or stats.stale >= 10:
+            latencies = sorted(stats.latencies)
+            rank = min(int(len(latencies) * self.options.percentile / 100), len(latencies) - 1)
+            stats.delay = latencies[rank]
+            stats.stale = 0
+        return stats.delay
+
+    @staticmethod
+    def _record_primary(
+        stats: HedgeStats, primary: asyncio.Future[Response], started: float) -> None:
+        # The primary request's own latency, not the one a winning hedge
+        # gave the caller, or the hedge delay would keep shrinking. A primary
+        # cancelled by a hedge counts as taking as long as it ran
+        if primary.cancelled() or primary.exception() is None:
+            HedgingMiddleware._record(stats, time.perf_counter() - started)
+
+    @staticmethod
+    def _record(stats: HedgeStats, elapsed: float) -> None:
+        stats.latencies.append(elapsed)
+        stats.stale += 1
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        # hedges_won counts the hedges that answered before the original request
+        return [{
+            'route': route,
+            'method': method,
+            'requests': stats.requests,
+            'hedges_sent': stats.hedges_sent,
+            'hedges_won': stats.hedges_won,
+            'delay_ms': stats.delay * 1000 if stats.delay is not None else None,
+        } for (method, route), stats in self._routes.items()]
+
+    def route_stats(self, method: str, path: str) -> HedgeStats:
+        # Routes are grouped the same way as GraphMetrics
+        key = (method, GraphMetrics.route_template(path))
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = HedgeStats(self.options.sample_size)
+        return stats
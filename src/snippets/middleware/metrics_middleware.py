@@ -0,0 +1,166 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import re
+import time
+from bisect import bisect_left
+from typing import Any, AsyncIterator
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import AsyncByteStream, Request, Response, AsyncBaseTransport
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Path segments that identify a single resource: GUIDs, numbers and Graph's
+# long base64 item ids. Collapsing them keeps the number of routes bounded
+ID_SEGMENT = re.compile(
+    r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+|[A-Za-z0-9_=+-]{32,})$',
+    re.IGNORECASE)
+
+# Upper bound on distinct raw paths remembered by the route template cache
+MAX_ROUTE_CACHE = 10000
+
+class RouteStats:
+    # pylint: disable=too-few-public-methods
+    __slots__ = ('buckets', 'count', 'total_seconds', 'statuses', 'bytes_sent', 'bytes_received')
+
+    def __init__(self) -> None:
+        # One counter per bucket plus an overflow counter for +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statuses: dict[int, int] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+class GraphMetrics:
+    in_flight: int
+
+    # Templates of the raw paths seen so far, shared by every middleware
+    # that groups requests by route
+    _route_templates: dict[str, str] = {}
+
+    def __init__(self) -> None:
+        # Middleware runs on the event loop thread, so plain integer
+        # updates are safe without locks
+        self._routes: dict[tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+
+    def route_stats(self, method: str, path: str) -> RouteStats:
+        route = GraphMetrics.route_template(path)
+        stats = self._routes.get((method, route))
+        if stats is None:
+            stats = self._routes[(method, route)] = RouteStats()
+        return stats
+
+    @staticmethod
+    def route_template(path: str) -> str:
+        # Memoized, matching every segment against ID_SEGMENT on every
+        # request would cost more than the rest of the bookkeeping
+        route = GraphMetrics._route_templates.get(path)
+        if route is None:
+            if len(GraphMetrics._route_templates) >= MAX_ROUTE_CACHE:
+                GraphMetrics._route_templates.clear()
+            route = GraphMetrics._route_templates[path] = '/'.join(
+                '{id}' if ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+        return route
+
+    def snapshot(self) -> dict[str, Any]:
+        routes = []
+        for (method, route), stats in self._routes.items():
+            routes.append({
+                'method': method,
+                'route': route,
+                'count': stats.count,
+                'total_seconds': stats.total_seconds,
+                'buckets': dict(zip([*LATENCY_BUCKETS, float('inf')], stats.buckets)),
+                'statuses': dict(stats.statuses),
+                'bytes_sent': stats.bytes_sent,
+                'bytes_received': stats.bytes_received,
+            })
+        return {'in_flight': self.in_flight, 'routes': routes}
+
+    def prometheus_text(self) -> str:
+        # Formatting only happens here, when a snapshot is exported
+        lines = [
+            '# TYPE graph_requests_in_flight gauge',
+            f'graph_requests_in_flight {self.in_flight}',
+            '# TYPE graph_request_duration_seconds histogram',
+        ]
+        for (method, route), stats in self._routes.items():
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(
+                    f'graph_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(
+                f'graph_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f'graph_request_duration_seconds_sum{{{labels}}} {stats.total_seconds}')
+            lines.append(f'graph_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+        lines.append('# TYPE graph_responses_total counter')
+        for (method, route), stats in self._routes.items():
+            for status, count in stats.statuses.items():
+                lines.append(f'graph_responses_total{{method="{method}",route="{route}",'
+                             f'status="{status}"}} {count}')
+
+        lines.append('# TYPE graph_request_bytes_total counter')
+        lines.append('# TYPE graph_response_bytes_total counter')
+        for (method, route), stats in self._routes.items():
+            labels = f'method="{method}",route="{route}"'
+            lines.append(f'graph_request_bytes_total{{{labels}}} {stats.bytes_sent}')
+            lines.append(f'graph_response_bytes_total{{{labels}}} {stats.bytes_received}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        self._routes.clear()
+
+# Shared by every MetricsMiddleware that isn't given its own GraphMetrics
+DEFAULT_METRICS = GraphMetrics()
+
+class _CountingStream(AsyncByteStream):
+    # Counts response bytes as the caller reads them, without buffering the body
+    def __init__(self, stream: Any, stats: RouteStats) -> None:
+        self._stream = stream
+        self._stats = stats
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._stats.bytes_received += len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+# pylint: disable=too-few-public-methods
+class MetricsMiddleware(BaseMiddleware):
+    metrics: GraphMetrics
+
+    def __init__(self, metrics: GraphMetrics | None = None) -> None:
+        super().__init__()
+        self.metrics = metrics or DEFAULT_METRICS
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        metrics = self.metrics
+        stats = metrics.route_stats(request.method, request.url.path)
+        content_length = request.headers.get('content-length')
+        if content_length:
+            stats.bytes_sent += int(content_length)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await super().send(request, transport)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            stats.count += 1
+            stats.total_seconds += elapsed
+
+        status = response.status_code
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        response.stream = _CountingStream(response.stream, stats)
+        return response
@@ -0,0 +1,89 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import Request, Response, AsyncBaseTransport
+from snippets.middleware.cache_middleware import CacheEntry, DROPPED_HEADERS, request_key
+
+# Only safe methods are coalesced, everything else is sent as is
+DEFAULT_METHODS = ('GET', 'HEAD')
+
+# pylint: disable=too-few-public-methods
+class _Flight:
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self) -> None:
+        self.future: asyncio.Future[CacheEntry | None] = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+
+# pylint: disable=too-few-public-methods
+class SingleFlightMiddleware(BaseMiddleware):
+    sent: int
+    deduplicated: int
+
+    def __init__(self, methods: tuple[str, ...] = DEFAULT_METHODS) -> None:
+        # Concurrent requests with the same method, URL and vary headers,
+        # which include the Authorization header, share one call. Add it
+        # first in the middleware list so retries and redirects are shared too
+        super().__init__()
+        self.methods = frozenset(method.upper() for method in methods)
+        self._in_flight: dict[str, _Flight] = {}
+        self.sent = 0
+        self.deduplicated = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        if request.method not in self.methods:
+            return await super().send(request, transport)
+
+        key = f'{request.method} {request_key(request)}'
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self.deduplicated += 1
+            flight.waiters += 1
+            # Shielded, so a caller that gives up doesn't cancel the shared call
+            shared = await asyncio.shield(flight.future)
+            if shared is not None:
+                return shared.to_response(request)
+            # The leader's response wasn't shareable, send this one separately
+            return await super().send(request, transport)
+
+        flight = self._in_flight[key] = _Flight()
+        self.sent += 1
+        try:
+            response = await super().send(request, transport)
+            # Nobody else is waiting, so the response doesn't need copying
+            shared = await SingleFlightMiddleware._share(request, response) \
+                if flight.waiters else None
+        except asyncio.CancelledError:
+            flight.future.set_result(None)
+            raise
+        except Exception as error:
+            flight.future.set_exception(error)
+            # Marks the error as retrieved when no other caller was waiting
+            flight.future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+        flight.future.set_result(shared)
+        return shared.to_response(request) if shared is not None else response
+
+    @staticmethod
+    async def _share(request: Request, response: Response) -> CacheEntry | None:
+        # JSON and empty bodies are read so every caller gets its own
+        # response. Anything else, such as file content, is left
+        # streaming for the leader only
+        content_type = response.headers.get('content-type', '')
+        if 'json' not in content_type and response.headers.get('content-length') != '0' \
+                and response.status_code not in (204, 304):
+            return None
+
+        content = await response.aread()
+        headers = [(name, value) for name, value in response.headers.multi_items()
+                   if name.lower() not in DROPPED_HEADERS]
+        return CacheEntry(request.url.path.lower(), response.status_code, headers, content, 0.0)
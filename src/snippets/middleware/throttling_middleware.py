@@ -0,0 +1,189 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any
+from kiota_http.middleware.middleware import BaseMiddleware
+from httpx import Request, Response, AsyncBaseTransport
+
+# Status codes Graph uses to signal throttling
+THROTTLED_STATUS_CODES = (429, 503)
+
+# Segments that address a container, the resource is the segment after its id
+CONTAINER_SEGMENTS = {'me', 'users', 'groups', 'teams', 'sites', 'drives', 'chats'}
+
+# Upper bound on distinct authorization headers remembered for tenant lookups
+MAX_TENANT_CACHE = 1000
+
+# pylint: disable=too-few-public-methods
+class ThrottlingOptions:
+    def __init__(
+        self,
+        requests_per_second: float = 16.0,
+        burst: int = 32,
+        initial_window: float = 8.0,
+        max_window: float = 64.0,
+        default_retry_after: float = 5.0) -> None:
+        # requests_per_second and burst size the token bucket, the window
+        # is the number of requests allowed in flight at once. The window
+        # grows by one for every window's worth of successful responses and
+        # is halved on the first throttled response of a window
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.initial_window = initial_window
+        self.max_window = max_window
+        self.default_retry_after = default_retry_after
+
+class ThrottleState:
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, options: ThrottlingOptions) -> None:
+        self._options = options
+        self._condition = asyncio.Condition()
+        self.tokens = float(options.burst)
+        self.refilled = time.monotonic()
+        self.window = options.initial_window
+        self.in_flight = 0
+        self.epoch = 0
+        self.retry_deadline = 0.0
+        self.throttled = 0
+
+    async def acquire(self) -> int:
+        # Returns the congestion epoch the request was sent in
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self.retry_deadline:
+                    # Every task waits for the same Retry-After deadline
+                    delay = self.retry_deadline - now
+                elif self.in_flight >= max(1, int(self.window)):
+                    await self._condition.wait()
+                    continue
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return self.epoch
+                    delay = (1 - self.tokens) / self._options.requests_per_second
+
+                try:
+                    # Released slots and new deadlines wake waiters early
+                    await asyncio.wait_for(self._condition.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, epoch: int, succeeded: bool, retry_after: float | None) -> None:
+        # retry_after is None unless the response was throttled
+        async with self._condition:
+            self.in_flight -= 1
+            if retry_after is not None:
+                self.throttled += 1
+                self.retry_deadline = max(self.retry_deadline, time.monotonic() + retry_after)
+                # Responses to requests sent before the last decrease
+                # were already accounted for by it
+                if epoch == self.epoch:
+                    self.window = max(1.0, self.window / 2)
+                    self.tokens = 0.0
+                    self.epoch += 1
+            elif succeeded:
+                self.window = min(self._options.max_window, self.window + 1 / self.window)
+            self._condition.notify_all()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.refilled
+        self.refilled = now
+        self.tokens = min(float(self._options.burst),
+                          self.tokens + elapsed * self._options.requests_per_second)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    options: ThrottlingOptions
+
+    def __init__(self, options: ThrottlingOptions | None = None) -> None:
+        # Add after the default middleware, so the retry handler's
+        # retries are paced by the shared state too
+        super().__init__()
+        self.options = options or ThrottlingOptions()
+        self._states: dict[tuple[str, str], ThrottleState] = {}
+        self._tenants: dict[str, str] = {}
+
+    async def send(self, request: Request, transport: AsyncBaseTransport) -> Response:
+        state = self.state_for(
+            self._tenant_for(request), ThrottlingMiddleware._resource_for(request))
+        epoch = await state.acquire()
+        succeeded = False
+        retry_after = None
+        try:
+            response = await super().send(request, transport)
+            if response.status_code in THROTTLED_STATUS_CODES:
+                retry_after = self._retry_after(response)
+            else:
+                succeeded = response.status_code < 500
+        finally:
+            await state.release(epoch, succeeded, retry_after)
+        return response
+
+    def state_for(self, tenant: str, resource: str) -> ThrottleState:
+        state = self._states.get((tenant, resource))
+        if state is None:
+            state = self._states[(tenant, resource)] = ThrottleState(self.options)
+        return state
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [{
+            'tenant': tenant,
+            'resource': resource,
+            'window': state.window,
+            'in_flight': state.in_flight,
+            'throttled': state.throttled,
+        } for (tenant, resource), state in self._states.items()]
+
+    def _tenant_for(self, request: Request) -> str:
+        authorization = request.headers.get('authorization', '')
+        key = hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            if len(self._tenants) >= MAX_TENANT_CACHE:
+                self._tenants.clear()
+            tenant = self._tenants[key] = ThrottlingMiddleware._tenant_from_token(authorization)
+        return tenant
+
+    @staticmethod
+    def _tenant_from_token(authorization: str) -> str:
+        # Read the tid claim without validating the token, it is only used
+        # to group requests. Tokens that aren't JWTs share one bucket
+        try:
+            payload = authorization.split(' ', 1)[1].split('.')[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            return str(claims.get('tid', 'default'))
+        except (IndexError, ValueError, AttributeError):
+            return 'default'
+
+    @staticmethod
+    def _resource_for(request: Request) -> str:
+        # /v1.0/me/messages/{id} -> messages, /v1.0/users/{id}/events -> events
+        segments = [segment for segment in request.url.path.lower().split('/') if segment][1:]
+        if not segments:
+            return ''
+        if segments[0] == 'me' and len(segments) > 1:
+            return segments[1]
+        if segments[0] in CONTAINER_SEGMENTS and len(segments) > 2:
+            return segments[2]
+        return segments[0]
+
+    def _retry_after(self, response: Response) -> float:
+        value = response.headers.get('retry-after')
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                pass
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+        return self.options.default_retry_after
@@ -1,14 +1,104 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from azure.identity import InteractiveBrowserCredential
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+from azure.identity import AzureAuthorityHosts, InteractiveBrowserCredential
+from azure.identity.aio import ClientSecretCredential
 from kiota_authentication_azure.azure_identity_authentication_provider import (
     AzureIdentityAuthenticationProvider)
 from msgraph.graph_service_client import GraphServiceClient
 from msgraph.graph_request_adapter import GraphRequestAdapter
-from msgraph_core import GraphClientFactory, NationalClouds
+from msgraph_core import APIVersion, GraphClientFactory, NationalClouds
+from snippets.client_registry import ClientKey, ConnectionPoolOptions, GraphClientRegistry
+from snippets.token_cache import TokenRefresher
+
+# Microsoft Entra sign-in endpoint for each national cloud
+AUTHORITY_HOSTS = {
+    NationalClouds.Global: AzureAuthorityHosts.AZURE_PUBLIC_CLOUD,
+    NationalClouds.US_GOV: AzureAuthorityHosts.AZURE_GOVERNMENT,
+    NationalClouds.US_DoD: AzureAuthorityHosts.AZURE_GOVERNMENT,
+    NationalClouds.China: AzureAuthorityHosts.AZURE_CHINA,
+}
+
+# Long enough that connections opened at startup are still open when
+# the first requests arrive after a deploy
+WARM_KEEPALIVE_EXPIRY = 300.0
+
+class MultiCloudPool:
+    def __init__(self, registry: GraphClientRegistry | None = None) -> None:
+        # One client per national cloud, each with its own credential
+        # and connection pool
+        self._registry = registry or GraphClientRegistry(
+            ConnectionPoolOptions(keepalive_expiry=WARM_KEEPALIVE_EXPIRY))
+        self._clouds: dict[NationalClouds, tuple[ClientKey, Callable[[], Any]]] = {}
+
+    def add(
+        self,
+        cloud: NationalClouds,
+        tenant_id: str,
+        client_id: str,
+        credential_factory: Callable[[], Any]) -> None:
+        # The credential must sign in against the cloud's authority host,
+        # see AUTHORITY_HOSTS
+        host = cloud.value
+        key = ClientKey(tenant_id, client_id, (f'{host}/.default',), host)
+        self._clouds[cloud] = (key, credential_factory)
+
+    def get_client(self, cloud: NationalClouds) -> GraphServiceClient:
+        key, credential_factory = self._clouds[cloud]
+        return self._registry.get_client(key, credential_factory)
+
+    async def warm_up(self, timeout: float = 30.0) -> dict[str, dict[str, Any]]:
+        # Opens a connection and gets a token for every cloud at once, so
+        # startup takes as long as the slowest cloud. Returns the time each
+        # step took per cloud. A cloud that fails to warm up reports its
+        # error, its first request then pays for the warm-up instead
+        clouds = list(self._clouds)
+        results = await asyncio.gather(*[self._warm_up_cloud(cloud, timeout) for cloud in clouds])
+        return {cloud.name: result for cloud, result in zip(clouds, results)}
+
+    async def _warm_up_cloud(self, cloud: NationalClouds, timeout: float) -> dict[str, Any]:
+        started = time.perf_counter()
+        result: dict[str, Any] = {
+            'seconds': 0.0, 'connect_seconds': None, 'token_seconds': None, 'error': None}
+
+        async def timed(awaitable: Awaitable[Any]) -> float:
+            step_started = time.perf_counter()
+            await awaitable
+            return time.perf_counter() - step_started
+
+        key, _ = self._clouds[cloud]
+        try:
+            self.get_client(cloud)
+            http_client = self._registry.get_http_client(key)
+            credential = self._registry.get_credential(key)
+            if http_client is None or credential is None:
+                raise RuntimeError(f'No client for {cloud.name}')
+
+            # Any response will do, the connection stays in the pool
+            steps = await asyncio.wait_for(
+                asyncio.gather(
+                    timed(http_client.head(f'{key.host}/{APIVersion.v1}/')),
+                    timed(TokenRefresher(credential, list(key.scopes)).refresh()),
+                    return_exceptions=True),
+                timeout)
+        except Exception as error: # pylint: disable=broad-exception-caught
+            steps = [error]
+
+        for name, step in zip(('connect_seconds', 'token_seconds'), steps):
+            if isinstance(step, BaseException):
+                result['error'] = result['error'] or f'{type(step).__name__}: {step}'
+            else:
+                result[name] = step
+
+        result['seconds'] = time.perf_counter() - started
+        return result
+
+    async def aclose(self) -> None:
+        await self._registry.aclose()
 
-# pylint: disable=too-few-public-methods
 class NationalCloudClients:
     @staticmethod
     def create_client_for_us_gov() -> GraphServiceClient:
@@ -33,3 +123,33 @@ class NationalCloudClients:
         # </NationalCloudSnippet>
 
         return graph_client
+
+    @staticmethod
+    async def create_multi_cloud_pool() -> MultiCloudPool:
+        # Values from the app registration in each cloud
+        clouds = [
+            (NationalClouds.Global, 'YOUR_TENANT_ID', 'YOUR_CLIENT_ID', 'YOUR_CLIENT_SECRET'),
+            (NationalClouds.US_GOV, 'YOUR_US_GOV_TENANT_ID', 'YOUR_US_GOV_CLIENT_ID',
+             'YOUR_US_GOV_CLIENT_SECRET'),
+            (NationalClouds.China, 'YOUR_CHINA_TENANT_ID', 'YOUR_CHINA_CLIENT_ID',
+             'YOUR_CHINA_CLIENT_SECRET'),
+        ]
+
+        pool = MultiCloudPool()
+        for cloud, tenant_id, client_id, client_secret in clouds:
+            # Bind the loop variables, the factory is called on first use
+            def credential_factory(cloud: NationalClouds = cloud, tenant_id: str = tenant_id,
+                                   client_id: str = client_id,
+                                   client_secret: str = client_secret) -> Any:
+                # azure.identity.aio
+                return ClientSecretCredential(
+                    tenant_id, client_id, client_secret, authority=AUTHORITY_HOSTS[cloud])
+
+            pool.add(cloud, tenant_id, client_id, credential_factory)
+
+        # Call once at startup, before serving the first request
+        for cloud, result in (await pool.warm_up()).items():
+            print(f'{cloud}: warm in {result["seconds"]:.2f}s',
+                  result['error'] or '')
+
+        return pool
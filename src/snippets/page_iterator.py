@@ -0,0 +1,99 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+from typing import Any, AsyncIterator
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from msgraph.generated.users.item.messages.messages_request_builder import MessagesRequestBuilder
+from msgraph.generated.models.message import Message
+from msgraph.graph_service_client import GraphServiceClient
+
+class PrefetchPageIterator:
+    pages_fetched: int
+
+    def __init__(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration | None = None,
+        max_pages_in_memory: int = 2) -> None:
+        # request_builder is any collection request builder, for example
+        # graph_client.me.messages, with get() and with_url() methods.
+        # Pages being fetched, queued, or iterated all count against
+        # max_pages_in_memory, so 1 disables prefetching
+        if max_pages_in_memory < 1:
+            raise ValueError('max_pages_in_memory must be at least 1')
+        self._request_builder = request_builder
+        self._request_configuration = request_configuration
+        self._max_pages_in_memory = max_pages_in_memory
+        self.pages_fetched = 0
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self.items()
+
+    async def items(self) -> AsyncIterator[Any]:
+        slots = asyncio.Semaphore(self._max_pages_in_memory)
+        pages: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self._fetch_pages(slots, pages))
+
+        try:
+            while True:
+                page = await pages.get()
+                if isinstance(page, BaseException):
+                    raise page
+                if page is None:
+                    return
+
+                values = page.value or []
+                del page
+                for item in values:
+                    yield item
+
+                # Free the slot so the next page can be fetched
+                del values
+                slots.release()
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _fetch_pages(self, slots: asyncio.Semaphore, pages: asyncio.Queue) -> None:
+        try:
+            await slots.acquire()
+            page = await self._request_builder.get(self._request_configuration)
+            while page is not None:
+                self.pages_fetched += 1
+                next_link = page.odata_next_link
+                await pages.put(page)
+                del page
+                if not next_link:
+                    break
+
+                # The next link already carries the query parameters
+                # from the original request
+                await slots.acquire()
+                page = await self._request_builder.with_url(next_link).get()
+
+            await pages.put(None)
+        except Exception as error: # pylint: disable=broad-exception-caught
+            await pages.put(error)
+
+# pylint: disable=too-few-public-methods
+class PageIterators:
+    @staticmethod
+    async def iterate_all_messages(graph_client: GraphServiceClient) -> int:
+        # GET https://graph.microsoft.com/v1.0/me/messages?$select=subject,sender&$top=100
+        query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+            select=['subject', 'sender'],
+            top=100
+        )
+
+        config = RequestConfiguration(
+            query_parameters=query_params
+        )
+
+        count = 0
+        message: Message
+        async for message in PrefetchPageIterator(graph_client.me.messages, config):
+            print(message.subject)
+            count += 1
+
+        return count
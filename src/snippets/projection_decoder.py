@@ -0,0 +1,171 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import re
+from typing import Any, AsyncIterator
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from msgraph.generated.users.item.user_item_request_builder import UserItemRequestBuilder
+from msgraph.generated.users.item.messages.messages_request_builder import MessagesRequestBuilder
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.graph_service_client import GraphServiceClient
+
+CAMEL_CASE_BOUNDARY = re.compile(r'(?<!^)(?=[A-Z])')
+
+class ProjectionRecord:
+    # Base class for the generated record types. Attributes use the
+    # snake_case names of the Kiota models, so display_name, job_title,
+    # but nested objects stay as the decoded JSON dictionaries. The Graph
+    # names are kept in _fields, a selected property can be named fields
+    __slots__ = ()
+    _fields: tuple[str, ...] = ()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {field: getattr(self, attribute)
+                for field, attribute in zip(self._fields, self.__slots__)}
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{attribute}={getattr(self, attribute)!r}'
+                           for attribute in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+class ProjectionDecoder:
+    def __init__(self, graph_client: GraphServiceClient, follow_next_links: bool = False) -> None:
+        # The fields decoded are the ones in the request's $select, plus id.
+        # With follow_next_links, every page of a collection is fetched
+        self._request_adapter = graph_client.request_adapter
+        self._follow_next_links = follow_next_links
+        self._record_types: dict[tuple[str, ...], type[ProjectionRecord]] = {}
+
+    async def get_record(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration) -> ProjectionRecord | None:
+        # request_builder is any item request builder, for example graph_client.me
+        fields = ProjectionDecoder._fields(request_configuration)
+        body = await self._get_json(request_builder, request_configuration)
+        return self._to_record(self.record_type(fields), fields, body) if body else None
+
+    async def get_records(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration,
+        full_models: bool = False) -> list[Any]:
+        # request_builder is any collection request builder, for example
+        # graph_client.me.messages. full_models falls back to the Kiota models
+        if full_models:
+            return await self._get_models(request_builder, request_configuration)
+
+        fields = ProjectionDecoder._fields(request_configuration)
+        record_type = self.record_type(fields)
+        return [self._to_record(record_type, fields, item)
+                async for item in self._get_items(request_builder, request_configuration)]
+
+    async def get_columns(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration) -> dict[str, list[Any]]:
+        # One list per field, for example columns['subject'][i] is the
+        # subject of the i-th message. Cheaper than records for large listings
+        fields = ProjectionDecoder._fields(request_configuration)
+        columns: list[list[Any]] = [[] for _ in fields]
+        async for item in self._get_items(request_builder, request_configuration):
+            for column, field in zip(columns, fields):
+                column.append(item.get(field))
+        return dict(zip((ProjectionDecoder._attribute(field) for field in fields), columns))
+
+    def record_type(self, fields: tuple[str, ...]) -> type[ProjectionRecord]:
+        record_type = self._record_types.get(fields)
+        if record_type is None:
+            record_type = type('Record', (ProjectionRecord,), {
+                '__slots__': tuple(ProjectionDecoder._attribute(field) for field in fields),
+                '_fields': fields,
+            })
+            self._record_types[fields] = record_type
+        return record_type
+
+    @staticmethod
+    def _to_record(
+        record_type: type[ProjectionRecord],
+        fields: tuple[str, ...],
+        item: dict[str, Any]) -> ProjectionRecord:
+        record = record_type.__new__(record_type)
+        for field, attribute in zip(fields, record_type.__slots__):
+            setattr(record, attribute, item.get(field))
+        return record
+
+    async def _get_items(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration) -> AsyncIterator[dict[str, Any]]:
+        body = await self._get_json(request_builder, request_configuration)
+        while body:
+            for item in body.get('value', []):
+                yield item
+
+            next_link = body.get('@odata.nextLink')
+            if not next_link or not self._follow_next_links:
+                break
+            body = await self._get_json(request_builder.with_url(next_link), None)
+
+    async def _get_models(
+        self, request_builder: Any, request_configuration: RequestConfiguration) -> list[Any]:
+        page = await request_builder.get(request_configuration)
+        items: list[Any] = []
+        while page:
+            items.extend(page.value or [])
+            if not page.odata_next_link or not self._follow_next_links:
+                break
+            page = await request_builder.with_url(page.odata_next_link).get()
+        return items
+
+    async def _get_json(
+        self,
+        request_builder: Any,
+        request_configuration: RequestConfiguration | None) -> dict[str, Any] | None:
+        # Ask for the raw body and decode it with the json module, skipping
+        # the parse node and backing store work done for full models
+        request_info = request_builder.to_get_request_information(request_configuration)
+        content = await self._request_adapter.send_primitive_async(
+            request_info, 'bytes', {'XXX': ODataError})
+        return json.loads(content) if content else None
+
+    @staticmethod
+    def _fields(request_configuration: RequestConfiguration) -> tuple[str, ...]:
+        query_parameters = request_configuration.query_parameters
+        select = getattr(query_parameters, 'select', None)
+        if not select:
+            raise ValueError('The request must $select the fields to decode')
+        return ('id', *[field for field in select if field != 'id'])
+
+    @staticmethod
+    def _attribute(field: str) -> str:
+        return CAMEL_CASE_BOUNDARY.sub('_', field).lower()
+
+class ProjectionRequests:
+    @staticmethod
+    async def make_select_request(graph_client: GraphServiceClient) -> ProjectionRecord | None:
+        # GET https://graph.microsoft.com/v1.0/me?$select=displayName,jobTitle
+        query_params = UserItemRequestBuilder.UserItemRequestBuilderGetQueryParameters(
+            select=['displayName', 'jobTitle']
+        )
+
+        config = RequestConfiguration(query_parameters=query_params)
+
+        user = await ProjectionDecoder(graph_client).get_record(graph_client.me, config)
+        return user
+
+    @staticmethod
+    async def make_list_request(graph_client: GraphServiceClient) -> list[ProjectionRecord]:
+        # GET https://graph.microsoft.com/v1.0/me/messages?
+        # $select=subject,sender&$filter=subject eq 'Hello world'
+        query_params = MessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+            select=['subject', 'sender'],
+            filter='subject eq \'Hello world\''
+        )
+
+        config = RequestConfiguration(query_parameters=query_params)
+
+        messages = await ProjectionDecoder(graph_client).get_records(
+            graph_client.me.messages, config)
+        return messages
@@ -0,0 +1,116 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+# pylint: disable=too-few-public-methods
+class ScheduledRequest:
+    name: str
+    factory: Callable[[], Awaitable[Any]]
+    depends_on: list[str]
+    started: float
+    finished: float
+
+    def __init__(
+        self, name: str, factory: Callable[[], Awaitable[Any]], depends_on: list[str]) -> None:
+        self.name = name
+        self.factory = factory
+        self.depends_on = depends_on
+        self.started = 0.0
+        self.finished = 0.0
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+class ScheduleReport:
+    wall_time: float
+    serial_time: float
+    critical_path_time: float
+    critical_path: list[str]
+    durations: dict[str, float]
+
+    def __init__(self, requests: list[ScheduledRequest], wall_time: float) -> None:
+        self.wall_time = wall_time
+        self.durations = {request.name: request.duration for request in requests}
+        self.serial_time = sum(self.durations.values())
+
+        # Longest chain of dependent durations ending at each request.
+        # Requests are stored in insertion order, which is a topological
+        # order because dependencies must be added first
+        path_time: dict[str, float] = {}
+        path_prev: dict[str, str | None] = {}
+        for request in requests:
+            prev = max(request.depends_on, key=lambda name: path_time[name], default=None)
+            path_time[request.name] = request.duration + (path_time[prev] if prev else 0.0)
+            path_prev[request.name] = prev
+
+        last = max(path_time, key=lambda name: path_time[name], default=None)
+        self.critical_path_time = path_time[last] if last else 0.0
+        self.critical_path = []
+        while last:
+            self.critical_path.insert(0, last)
+            last = path_prev[last]
+
+    def __str__(self) -> str:
+        lines = [f'{name}: {duration * 1000:.1f} ms' for name, duration in self.durations.items()]
+        lines.append(f'Serial time: {self.serial_time * 1000:.1f} ms')
+        lines.append(f'Critical path time: {self.critical_path_time * 1000:.1f} ms')
+        lines.append(f'Wall time: {self.wall_time * 1000:.1f} ms')
+        lines.append(f'Critical path: {" -> ".join(self.critical_path)}')
+        return '\n'.join(lines)
+
+class RequestScheduler:
+    max_concurrency: int
+
+    def __init__(self, max_concurrency: int = 4) -> None:
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be at least 1')
+        self.max_concurrency = max_concurrency
+        self._requests: dict[str, ScheduledRequest] = {}
+        self._results: dict[str, Any] = {}
+
+    def add(
+        self,
+        name: str,
+        factory: Callable[[], Awaitable[Any]],
+        depends_on: list[str] | None = None) -> None:
+        # Dependencies must already be scheduled, so the graph can't contain cycles
+        if name in self._requests:
+            raise ValueError(f'Request {name} is already scheduled')
+        for dependency in depends_on or []:
+            if dependency not in self._requests:
+                raise ValueError(f'Request {name} depends on unknown request {dependency}')
+
+        self._requests[name] = ScheduledRequest(name, factory, list(depends_on or []))
+
+    def result(self, name: str) -> Any:
+        return self._results[name]
+
+    async def run(self) -> ScheduleReport:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_request(request: ScheduledRequest) -> None:
+            if request.depends_on:
+                await asyncio.gather(*(tasks[name] for name in request.depends_on))
+            async with semaphore:
+                request.started = time.perf_counter()
+                self._results[request.name] = await request.factory()
+                request.finished = time.perf_counter()
+
+        started = time.perf_counter()
+        for request in self._requests.values():
+            tasks[request.name] = asyncio.create_task(run_request(request))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            # If one request fails, don't leave the others running
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        return ScheduleReport(list(self._requests.values()), time.perf_counter() - started)
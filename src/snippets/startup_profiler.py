@@ -0,0 +1,73 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+# Runs in a fresh interpreter, so nothing is already imported. Imports the
+# modules in order and prints what each one added on top of the previous ones
+MEASURE_SCRIPT = '''
+import importlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+trace = sys.argv[2] == 'memory'
+if trace:
+    import tracemalloc
+    tracemalloc.start()
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+results = []
+for name in sys.argv[3:]:
+    modules = len(sys.modules)
+    started = time.perf_counter()
+    importlib.import_module(name)
+    results.append({
+        'module': name,
+        'seconds': time.perf_counter() - started,
+        'allocated_bytes': tracemalloc.get_traced_memory()[0] if trace else None,
+        'peak_rss_bytes': peak_rss(),
+        'modules_loaded': len(sys.modules) - modules,
+    })
+print(json.dumps(results))
+'''
+
+# pylint: disable=too-few-public-methods
+class StartupProfiler:
+    @staticmethod
+    def measure(modules: list[str], path: str, repeat: int = 5) -> list[dict[str, Any]]:
+        # Import time is the median of repeat cold runs. Memory comes from a
+        # separate run with tracemalloc, which slows imports down too much
+        # to time them in the same run
+        timings = [StartupProfiler._run(modules, path, 'time') for _ in range(repeat)]
+        memory = StartupProfiler._run(modules, path, 'memory')
+
+        results = []
+        previous_allocated = 0
+        for index, traced in enumerate(memory):
+            allocated = traced['allocated_bytes']
+            results.append({
+                'module': traced['module'],
+                'seconds': statistics.median(run[index]['seconds'] for run in timings),
+                'allocated_bytes': allocated - previous_allocated,
+                'peak_rss_bytes': timings[-1][index]['peak_rss_bytes'],
+                'modules_loaded': traced['modules_loaded'],
+            })
+            previous_allocated = allocated
+        return results
+
+    @staticmethod
+    def _run(modules: list[str], path: str, mode: str) -> list[dict[str, Any]]:
+        output = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT, path, mode, *modules],
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(output)
@@ -0,0 +1,216 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import hashlib
+import os
+import re
+from typing import Awaitable, Callable
+import httpx
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from kiota_abstractions.method import Method
+from kiota_abstractions.request_information import RequestInformation
+from kiota_abstractions.serialization.parse_node_factory_registry import (
+    ParseNodeFactoryRegistry)
+from msgraph.generated.users.item.messages.item.attachments.attachments_request_builder import (
+    AttachmentsRequestBuilder)
+from msgraph.generated.models.o_data_errors.o_data_error import ODataError
+from msgraph.graph_service_client import GraphServiceClient
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Receives the body one chunk at a time
+AsyncSink = Callable[[bytes], Awaitable[None]]
+
+class IntegrityError(Exception):
+    pass
+
+# pylint: disable=too-few-public-methods
+class DownloadItem:
+    def __init__(
+        self,
+        request_info: RequestInformation,
+        path: str,
+        expected_digest: str | None = None) -> None:
+        self.request_info = request_info
+        self.path = path
+        self.expected_digest = expected_digest
+
+# pylint: disable=too-few-public-methods
+class DownloadResult:
+    def __init__(
+        self,
+        path: str | None,
+        bytes_written: int = 0,
+        digest: str | None = None,
+        error: BaseException | None = None) -> None:
+        self.path = path
+        self.bytes_written = bytes_written
+        self.digest = digest
+        self.error = error
+
+class StreamingDownload:
+    def __init__(
+        self,
+        graph_client: GraphServiceClient,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_concurrency: int = 4) -> None:
+        # At most max_concurrency downloads run at once, each holding
+        # about one chunk in memory
+        self._request_adapter = graph_client.request_adapter
+        # kiota doesn't expose the client it sends requests with, and its
+        # send methods always read the whole body into memory
+        self._http_client: httpx.AsyncClient = getattr(self._request_adapter, '_http_client')
+        self._chunk_size = chunk_size
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def download(
+        self,
+        request_info: RequestInformation,
+        sink: AsyncSink,
+        hash_algorithm: str | None = None,
+        expected_digest: str | None = None) -> DownloadResult:
+        # hash_algorithm is any hashlib name, for example 'sha256'. The
+        # digest is computed while streaming and compared to expected_digest,
+        # case-insensitively, once the body is complete
+        digest = hashlib.new(hash_algorithm) if hash_algorithm else None
+        bytes_written = 0
+
+        async with self._slots:
+            request_info.path_parameters['baseurl'] = self._request_adapter.base_url
+            request = await self._request_adapter.convert_to_native_async(request_info)
+            response = await self._http_client.send(request, stream=True)
+            try:
+                if not response.is_success:
+                    raise await StreamingDownload._error_from_response(response)
+
+                async for chunk in response.aiter_bytes(self._chunk_size):
+                    if digest is not None:
+                        digest.update(chunk)
+                    await sink(chunk)
+                    bytes_written += len(chunk)
+            finally:
+                await response.aclose()
+
+        hex_digest = digest.hexdigest() if digest is not None else None
+        if expected_digest and hex_digest and hex_digest.lower() != expected_digest.lower():
+            raise IntegrityError(f'Expected {hash_algorithm} {expected_digest}, got {hex_digest}')
+        return DownloadResult(None, bytes_written, hex_digest)
+
+    async def download_to_file(
+        self,
+        request_info: RequestInformation,
+        path: str,
+        hash_algorithm: str | None = None,
+        expected_digest: str | None = None) -> DownloadResult:
+        # Written to a .partial file first, so an interrupted or corrupt
+        # download never leaves a file that looks complete
+        partial_path = path + '.partial'
+        with open(partial_path, 'wb') as target:
+            async def write(chunk: bytes) -> None:
+                await asyncio.to_thread(target.write, chunk)
+
+            try:
+                result = await self.download(request_info, write, hash_algorithm, expected_digest)
+            except BaseException:
+                target.close()
+                os.remove(partial_path)
+                raise
+
+        os.replace(partial_path, path)
+        result.path = path
+        return result
+
+    async def download_many(
+        self,
+        items: list[DownloadItem],
+        hash_algorithm: str | None = None) -> list[DownloadResult]:
+        # One result per item, in order. A failed download doesn't stop
+        # the others, its error is set on its result instead
+        async def download_item(item: DownloadItem) -> DownloadResult:
+            try:
+                return await self.download_to_file(
+                    item.request_info, item.path, hash_algorithm, item.expected_digest)
+            except Exception as error: # pylint: disable=broad-exception-caught
+                return DownloadResult(item.path, error=error)
+
+        return await asyncio.gather(*[download_item(item) for item in items])
+
+    @staticmethod
+    async def _error_from_response(response: httpx.Response) -> Exception:
+        content = await response.aread()
+        if 'json' not in response.headers.get('content-type', ''):
+            return httpx.HTTPStatusError(
+                f'Download failed with {response.status_code}',
+                request=response.request, response=response)
+
+        parse_node = ParseNodeFactoryRegistry().get_root_parse_node('application/json', content)
+        error = parse_node.get_object_value(ODataError)
+        error.response_status_code = response.status_code
+        return error
+
+class Downloads:
+    @staticmethod
+    def attachment_content_request(
+        graph_client: GraphServiceClient,
+        message_id: str,
+        attachment_id: str) -> RequestInformation:
+        # GET https://graph.microsoft.com/v1.0/me/messages/{message-id}/attachments/
+        # {attachment-id}/$value
+        # The SDK has no request builder for an attachment's raw content
+        builder = graph_client.me.messages.by_message_id(
+            message_id).attachments.by_attachment_id(attachment_id)
+        url_template = builder.url_template.split('{?', 1)[0] + '/$value'
+        return RequestInformation(Method.GET, url_template, dict(builder.path_parameters))
+
+    @staticmethod
+    def drive_item_content_request(
+        graph_client: GraphServiceClient,
+        drive_id: str,
+        item_id: str) -> RequestInformation:
+        # GET https://graph.microsoft.com/v1.0/drives/{drive-id}/items/{item-id}/content
+        return graph_client.drives.by_drive_id(drive_id).items.by_drive_item_id(
+            item_id).content.to_get_request_information()
+
+    @staticmethod
+    def message_mime_request(
+        graph_client: GraphServiceClient,
+        message_id: str) -> RequestInformation:
+        # GET https://graph.microsoft.com/v1.0/me/messages/{message-id}/$value
+        return graph_client.me.messages.by_message_id(
+            message_id).content.to_get_request_information()
+
+    @staticmethod
+    async def archive_message(
+        graph_client: GraphServiceClient,
+        message_id: str,
+        directory: str) -> list[DownloadResult]:
+        # Saves the message as MIME and each of its attachments as a file,
+        # instead of loading them all with $expand=attachments
+        # GET https://graph.microsoft.com/v1.0/me/messages/{message-id}/attachments?
+        # $select=id,name,size
+        query_params = AttachmentsRequestBuilder.AttachmentsRequestBuilderGetQueryParameters(
+            select=['id', 'name', 'size']
+        )
+
+        config = RequestConfiguration(
+            query_parameters=query_params
+        )
+
+        attachments = await graph_client.me.messages.by_message_id(
+            message_id).attachments.get(config)
+
+        os.makedirs(directory, exist_ok=True)
+        items = [DownloadItem(Downloads.message_mime_request(graph_client, message_id),
+                              os.path.join(directory, 'message.eml'))]
+        values = attachments.value if attachments and attachments.value else []
+        for index, attachment in enumerate(values):
+            # Reference attachments are links, they have no content to download
+            if not attachment.id or attachment.odata_type == '#microsoft.graph.referenceAttachment':
+                continue
+            name = re.sub(r'[^\w.\- ]', '_', os.path.basename(attachment.name or 'attachment'))
+            items.append(DownloadItem(
+                Downloads.attachment_content_request(graph_client, message_id, attachment.id),
+                os.path.join(directory, f'{index}-{name}')))
+
+        return await StreamingDownload(graph_client).download_many(items, 'sha256')
@@ -0,0 +1,272 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple
+import httpx
+from azure.identity.aio import CertificateCredential, ClientSecretCredential
+from kiota_abstractions.base_request_configuration import RequestConfiguration
+from kiota_abstractions.serialization.parsable import Parsable
+from kiota_authentication_azure.azure_identity_authentication_provider import (
+    AzureIdentityAuthenticationProvider)
+from kiota_serialization_json.json_serialization_writer import JsonSerializationWriter
+from msgraph.generated.groups.groups_request_builder import GroupsRequestBuilder
+from msgraph.generated.models.group_collection_response import GroupCollectionResponse
+from msgraph.generated.models.user_collection_response import UserCollectionResponse
+from msgraph.generated.users.users_request_builder import UsersRequestBuilder
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph.graph_request_adapter import GraphRequestAdapter, options as graph_options
+from msgraph_core import APIVersion, GraphClientFactory, NationalClouds
+from snippets.client_registry import ConnectionPoolOptions
+
+# A step takes the tenant's client and returns the value to report.
+# Steps sent to a process pool must be module-level functions or
+# static methods, so they can be pickled
+PlanStep = Callable[[GraphServiceClient], Awaitable[Any]]
+RequestPlan = list[tuple[str, PlanStep]]
+
+class TenantCredentials(NamedTuple):
+    # Values from each tenant's app registration, with either a client
+    # secret or the path to a certificate
+    tenant_id: str
+    client_id: str
+    client_secret: str | None = None
+    certificate_path: str | None = None
+
+    def create_credential(self) -> Any:
+        # azure.identity.aio
+        if self.certificate_path:
+            return CertificateCredential(self.tenant_id, self.client_id, self.certificate_path)
+        if not self.client_secret:
+            raise ValueError(f'Tenant {self.tenant_id} has no client secret or certificate')
+        return ClientSecretCredential(self.tenant_id, self.client_id, self.client_secret)
+
+# pylint: disable=too-few-public-methods
+class TenantResult:
+    def __init__(
+        self,
+        tenant_id: str,
+        step: str,
+        value: Any = None,
+        error: BaseException | None = None,
+        seconds: float = 0.0) -> None:
+        self.tenant_id = tenant_id
+        self.step = step
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    def to_portable(self) -> 'TenantResult':
+        # Kiota models and errors hold a backing store that can't be
+        # pickled, so results crossing a process boundary carry the
+        # model's JSON as a dictionary and the error as a message
+        value = self.value
+        if isinstance(value, Parsable):
+            writer = JsonSerializationWriter()
+            writer.write_object_value(None, value)
+            value = json.loads(writer.get_serialized_content())
+        error = RuntimeError(f'{type(self.error).__name__}: {self.error}') if self.error else None
+        return TenantResult(self.tenant_id, self.step, value, error, self.seconds)
+
+# pylint: disable=too-few-public-methods
+class FanOutOptions:
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        per_tenant_concurrency: int = 4,
+        scopes: list[str] | None = None,
+        host: str = NationalClouds.Global.value,
+        pool_options: ConnectionPoolOptions | None = None) -> None:
+        # max_concurrency bounds the requests in flight across all tenants,
+        # per_tenant_concurrency those of a single tenant, which keeps one
+        # tenant's plan from using up its throttling limits
+        self.max_concurrency = max_concurrency
+        self.per_tenant_concurrency = per_tenant_concurrency
+        # App-only clients must request the /.default scope
+        self.scopes = scopes or ['https://graph.microsoft.com/.default']
+        self.host = host
+        self.pool_options = pool_options or ConnectionPoolOptions()
+
+class TenantFanOut:
+    def __init__(
+        self,
+        plan: RequestPlan,
+        options: FanOutOptions | None = None,
+        http_client: httpx.AsyncClient | None = None) -> None:
+        # Every tenant runs every step of plan. The tenants share one
+        # HTTP client, only the credential differs between them
+        self._plan = plan
+        self._options = options or FanOutOptions()
+        self._http_client = http_client
+
+    async def run(self, tenants: list[TenantCredentials]) -> AsyncIterator[TenantResult]:
+        # Yields one result per tenant and step, in the order they finish.
+        # A failed step doesn't stop the others, its error is on its result
+        options = self._options
+        http_client = self._http_client or GraphClientFactory.create_with_default_middleware(
+            client=options.pool_options.create_http_client(options.host), options=graph_options)
+        global_slots = asyncio.Semaphore(options.max_concurrency)
+        results: asyncio.Queue[TenantResult] = asyncio.Queue()
+
+        async def run_step(
+            tenant_id: str,
+            graph_client: GraphServiceClient,
+            name: str,
+            step: PlanStep,
+            tenant_slots: asyncio.Semaphore) -> None:
+            async with tenant_slots, global_slots:
+                started = time.perf_counter()
+                try:
+                    value = await step(graph_client)
+                    result = TenantResult(tenant_id, name, value,
+                                          seconds=time.perf_counter() - started)
+                except Exception as error: # pylint: disable=broad-exception-caught
+                    result = TenantResult(tenant_id, name, error=error,
+                                          seconds=time.perf_counter() - started)
+            results.put_nowait(result)
+
+        async def run_tenant(tenant: TenantCredentials) -> None:
+            credential = None
+            try:
+                credential = tenant.create_credential()
+                graph_client = self._create_client(credential, http_client)
+            except Exception as error: # pylint: disable=broad-exception-caught
+                # For example a missing certificate file. Every step still
+                # gets a result, or run would wait for them forever
+                for name, _ in self._plan:
+                    results.put_nowait(TenantResult(tenant.tenant_id, name, error=error))
+                if credential is not None:
+                    await credential.close()
+                return
+
+            try:
+                tenant_slots = asyncio.Semaphore(options.per_tenant_concurrency)
+                await asyncio.gather(*[
+                    run_step(tenant.tenant_id, graph_client, name, step, tenant_slots)
+                    for name, step in self._plan])
+            finally:
+                await credential.close()
+
+        tasks = [asyncio.create_task(run_tenant(tenant)) for tenant in tenants]
+        try:
+            for _ in range(len(tenants) * len(self._plan)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._http_client is None:
+                await http_client.aclose()
+
+    async def run_sharded(
+        self,
+        tenants: list[TenantCredentials],
+        processes: int) -> AsyncIterator[TenantResult]:
+        # Splits the tenants across a process pool, for plans that spend
+        # more time parsing responses than waiting for them. Each process
+        # gets an equal share of max_concurrency, and results are streamed
+        # back as they finish, converted with TenantResult.to_portable
+        shards = [tenants[index::processes] for index in range(processes)]
+        shards = [shard for shard in shards if shard]
+        shard_options = FanOutOptions(
+            max(1, self._options.max_concurrency // len(shards)) if shards else 1,
+            self._options.per_tenant_concurrency,
+            self._options.scopes,
+            str(getattr(self._options.host, 'value', self._options.host)),
+            self._options.pool_options)
+
+        loop = asyncio.get_running_loop()
+        with multiprocessing.Manager() as manager, \
+             ProcessPoolExecutor(max_workers=max(1, len(shards))) as pool:
+            queue = manager.Queue()
+            futures = [loop.run_in_executor(pool, _run_shard, self._plan, shard,
+                                            shard_options, queue) for shard in shards]
+
+            # None is queued after each shard's results once it's done. It's
+            # queued from here rather than by the shard, so a shard whose
+            # process dies still ends the loop below
+            for future in futures:
+                future.add_done_callback(
+                    lambda _: loop.run_in_executor(None, queue.put, None))
+
+            remaining = len(futures)
+            while remaining:
+                result = await loop.run_in_executor(None, queue.get)
+                if result is None:
+                    remaining -= 1
+                else:
+                    yield result
+
+            # Raises the error of a shard that failed outside of a step
+            await asyncio.gather(*futures)
+
+    def _create_client(
+        self, credential: Any, http_client: httpx.AsyncClient) -> GraphServiceClient:
+        # NationalClouds members compare equal to their URL, but only
+        # format as one on some Python versions
+        host = str(getattr(self._options.host, 'value', self._options.host))
+        auth_provider = AzureIdentityAuthenticationProvider(
+            credential, scopes=self._options.scopes)
+        adapter = GraphRequestAdapter(auth_provider, http_client)
+        adapter.base_url = f'{host}/{APIVersion.v1}'
+        return GraphServiceClient(request_adapter=adapter)
+
+def _run_shard(
+    plan: RequestPlan,
+    tenants: list[TenantCredentials],
+    options: FanOutOptions,
+    queue: Any) -> None:
+    # Runs in a pool process with its own event loop and HTTP client
+    async def forward() -> None:
+        async for result in TenantFanOut(plan, options).run(tenants):
+            queue.put(result.to_portable())
+
+    asyncio.run(forward())
+
+class FanOutRequests:
+    # App-only clients have no signed-in user, so the plan uses /users
+    # and /groups instead of /me
+    @staticmethod
+    async def list_users(graph_client: GraphServiceClient) -> UserCollectionResponse | None:
+        # GET https://graph.microsoft.com/v1.0/users?$select=displayName,mail&$top=25
+        query_params = UsersRequestBuilder.UsersRequestBuilderGetQueryParameters(
+            select=['displayName', 'mail'], top=25)
+
+        config = RequestConfiguration(query_parameters=query_params)
+
+        users = await graph_client.users.get(config)
+        return users
+
+    @staticmethod
+    async def list_groups(graph_client: GraphServiceClient) -> GroupCollectionResponse | None:
+        # GET https://graph.microsoft.com/v1.0/groups?$select=displayName&$top=25
+        query_params = GroupsRequestBuilder.GroupsRequestBuilderGetQueryParameters(
+            select=['displayName'], top=25)
+
+        config = RequestConfiguration(query_parameters=query_params)
+
+        groups = await graph_client.groups.get(config)
+        return groups
+
+    @staticmethod
+    async def run_across_tenants(tenants: list[TenantCredentials]) -> None:
+        plan: RequestPlan = [
+            ('users', FanOutRequests.list_users),
+            ('groups', FanOutRequests.list_groups),
+        ]
+
+        async for result in TenantFanOut(plan).run(tenants):
+            if result.succeeded:
+                count = len(getattr(result.value, 'value', None) or [])
+                print(f'{result.tenant_id} {result.step}: {count} items '
+                      f'in {result.seconds:.2f}s')
+            else:
+                print(f'{result.tenant_id} {result.step} failed: {result.error}')
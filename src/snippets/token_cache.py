@@ -0,0 +1,112 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Any
+from azure.core.credentials import AccessTokenInfo, TokenRequestOptions
+from azure.identity import AuthenticationRecord, TokenCachePersistenceOptions
+
+# Name of the persistent cache shared by every credential in these samples
+TOKEN_CACHE_NAME = 'msgraph-snippets'
+
+# azure.identity hands out its cached token until it is this close to expiring
+CREDENTIAL_REFRESH_OFFSET = 300
+
+class PersistentTokenCache:
+    @staticmethod
+    def persistence_options(
+        allow_unencrypted_storage: bool = False) -> TokenCachePersistenceOptions:
+        # The cache is encrypted with DPAPI on Windows, the Keychain on macOS
+        # and libsecret on Linux. Only allow plain text where none of those
+        # exist, such as a headless container with a protected volume
+        return TokenCachePersistenceOptions(
+            name=TOKEN_CACHE_NAME, allow_unencrypted_storage=allow_unencrypted_storage)
+
+    @staticmethod
+    def load_authentication_record(path: str) -> AuthenticationRecord | None:
+        # The record only identifies the account, the tokens stay in the
+        # encrypted cache. Without it the credential can't find them and
+        # prompts again
+        try:
+            with open(path, 'r', encoding='utf-8') as record_file:
+                return AuthenticationRecord.deserialize(record_file.read())
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def save_authentication_record(record: AuthenticationRecord, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as record_file:
+            record_file.write(record.serialize())
+        os.chmod(path, 0o600)
+
+class TokenRefresher:
+    refreshes: int
+    failures: int
+
+    def __init__(self, credential: Any, scopes: list[str], retry_delay: float = 30.0) -> None:
+        # credential can be sync or async. Sync credentials are called on a
+        # worker thread so the event loop keeps serving requests
+        self._credential = credential
+        self._scopes = scopes
+        self._retry_delay = retry_delay
+        self._task: asyncio.Task | None = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                token = await self.refresh()
+                delay = TokenRefresher._seconds_until_refresh(token)
+            except Exception: # pylint: disable=broad-exception-caught
+                # Requests still get tokens on demand, just try again later
+                self.failures += 1
+                delay = self._retry_delay
+            await asyncio.sleep(delay)
+
+    async def refresh(self) -> AccessTokenInfo:
+        # Gets a token now, for example to warm the credential's cache at startup
+        token = await self._get_token_info()
+        self.refreshes += 1
+        return token
+
+    async def _get_token_info(self) -> AccessTokenInfo:
+        # Asks with the options Kiota's authentication provider uses.
+        # azure.identity caches CAE tokens apart from the others, so
+        # refreshing a non-CAE token wouldn't help any request
+        get_token_info = getattr(self._credential, 'get_token_info', None)
+        if get_token_info is None:
+            get_token = self._credential.get_token
+            if inspect.iscoroutinefunction(get_token):
+                token = await get_token(*self._scopes, enable_cae=True)
+            else:
+                token = await asyncio.to_thread(get_token, *self._scopes, enable_cae=True)
+            return AccessTokenInfo(token.token, token.expires_on)
+
+        options = TokenRequestOptions(enable_cae=True)
+        if inspect.iscoroutinefunction(get_token_info):
+            return await get_token_info(*self._scopes, options=options)
+        return await asyncio.to_thread(get_token_info, *self._scopes, options=options)
+
+    @staticmethod
+    def _seconds_until_refresh(token: AccessTokenInfo) -> float:
+        # The credential only replaces its cached token once refresh_on has
+        # passed or the token is about to expire. Ask again right then, so
+        # this task pays for the round trip instead of the next request
+        refresh_at = token.expires_on - CREDENTIAL_REFRESH_OFFSET
+        if token.refresh_on:
+            refresh_at = min(refresh_at, token.refresh_on)
+        return max(refresh_at - time.time() + 1, 1.0)